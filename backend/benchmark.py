@@ -0,0 +1,318 @@
+"""Benchmark the trivia API endpoints.
+
+Seeds a synthetic question bank of the given size into SQLite (default) or
+the database given with --database-url, then drives the endpoints through
+the Flask test client or a real threaded WSGI server, and reports p50/p99
+latency, requests per second and SQL queries per request.
+
+    python benchmark.py --size 100000 --mode wsgi --concurrency 8 \
+                        --output bench-100k.json
+
+With --cold-start it instead times create_app() in fresh interpreters,
+with and without creating the schema on startup (INIT_DB).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import statistics
+import subprocess
+import argparse
+import tempfile
+import platform
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from flaskr import create_app
+from models import db, init_db, Question, Category
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment',
+              'Sports']
+WORDS = ['title', 'river', 'author', 'planet', 'painter', 'king', 'movie',
+         'team', 'country', 'element', 'war', 'album', 'mountain', 'ocean']
+SEED_BATCH_SIZE = 10000
+
+
+def seed(size):
+    # Add synthetic categories and questions until there are `size` questions
+
+    if Category.query.count() == 0:
+        for category_type in CATEGORIES:
+            db.session.add(Category(type=category_type))
+        db.session.commit()
+    category_ids = [category.id for category in Category.query.all()]
+
+    rng = random.Random(size)
+    missing = size - Question.query.count()
+    while missing > 0:
+        batch = []
+        for _ in range(min(missing, SEED_BATCH_SIZE)):
+            words = ' '.join(rng.choice(WORDS) for _ in range(6))
+            batch.append({'question': f'Which {words}?',
+                          'answer': rng.choice(WORDS),
+                          'difficulty': rng.randint(1, 5),
+                          'category': rng.choice(category_ids)})
+        db.session.bulk_insert_mappings(Question, batch)
+        db.session.commit()
+        missing -= len(batch)
+
+
+class QueryCounter:
+    # Counts the SQL statements run on the engine, from any thread
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def scenarios(size, category_ids, question_ids):
+    """Return {name: function returning (method, path, json body)} for the
+       requests to benchmark; each call may return a different request.
+    """
+
+    last_page = max((size + 9) // 10, 1)
+
+    def quiz():
+        previous_questions = random.sample(question_ids,
+                                           min(20, len(question_ids)))
+        return 'POST', '/quizzes', {
+            'previous_questions': previous_questions,
+            'quiz_category': {'id': random.choice([0] + category_ids)}}
+
+    return {
+        'categories': lambda: ('GET', '/categories', None),
+        'questions_first_page': lambda: ('GET', '/questions?page=1', None),
+        'questions_random_page': lambda: (
+            'GET', f'/questions?page={random.randint(1, last_page)}', None),
+        'questions_cursor': lambda: (
+            'GET', f'/questions?after_id={random.choice(question_ids)}'
+                   '&limit=10', None),
+        'category_questions': lambda: (
+            'GET', f'/categories/{random.choice(category_ids)}/questions',
+            None),
+        'search': lambda: (
+            'POST', '/questions', {'searchTerm': random.choice(WORDS)}),
+        'quiz': quiz,
+    }
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Don't write an access log line per request while measuring
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def client_caller(app):
+    client = app.test_client()
+
+    def call(method, path, body):
+        response = client.open(path, method=method, json=body)
+        return response.status_code
+
+    return call
+
+
+def http_caller(base_url):
+    def call(method, path, body):
+        data = None
+        headers = {}
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(base_url + path, data=data,
+                                         headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return call
+
+
+COLD_START = """
+import time
+start = time.perf_counter()
+from flaskr import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': %r, 'INIT_DB': %r})
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure_cold_start(database_url, runs):
+    """Start `runs` fresh interpreters per mode and return the median
+       import and create_app() times, with and without INIT_DB.
+    """
+
+    results = {}
+    for name, init_db_on_start in [('init_db', True), ('lazy', False)]:
+        import_times, create_times = [], []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c',
+                 COLD_START % (database_url, init_db_on_start)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                check=True, stdout=subprocess.PIPE,
+                universal_newlines=True).stdout
+            import_time, create_time = map(float, output.split()[-2:])
+            import_times.append(import_time)
+            create_times.append(create_time)
+        results[name] = {
+            'runs': runs,
+            'import_ms': round(statistics.median(import_times) * 1000, 3),
+            'create_app_ms': round(statistics.median(create_times) * 1000, 3),
+        }
+    return results
+
+
+def percentile(sorted_values, percent):
+    index = int(round(percent / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def run_scenario(call, make_request, requests, concurrency, counter):
+    latencies = []
+    errors = 0
+
+    def one_request(_):
+        method, path, body = make_request()
+        start = time.perf_counter()
+        status = call(method, path, body)
+        return time.perf_counter() - start, status
+
+    queries_before = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, status in pool.map(one_request, range(requests)):
+            latencies.append(latency)
+            if status >= 400:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    queries = counter.count - queries_before
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / requests * 1000, 3),
+        'requests_per_second': round(requests / elapsed, 1),
+        'queries_per_request': round(queries / requests, 2),
+    }
+
+
+def run_scenarios(app, args, category_ids, question_ids, counter):
+    # Serve the app in the chosen mode and measure each scenario
+    server = None
+    if args.mode == 'wsgi':
+        server = make_server('127.0.0.1', 0, app, threaded=True,
+                             request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        call = http_caller(f'http://127.0.0.1:{server.server_port}')
+    else:
+        call = client_caller(app)
+
+    results = {}
+    for name, make_request in scenarios(args.size, category_ids,
+                                        question_ids).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        # Warm up caches and connections before measuring
+        run_scenario(call, make_request, min(args.requests, 10), 1, counter)
+        results[name] = run_scenario(call, make_request, args.requests,
+                                     args.concurrency, counter)
+        result = results[name]
+        print(f"{name:24} p50 {result['p50_ms']:9.3f} ms  "
+              f"p99 {result['p99_ms']:9.3f} ms  "
+              f"{result['requests_per_second']:8.1f} req/s  "
+              f"{result['queries_per_request']:5.2f} queries/req  "
+              f"{result['errors']} errors")
+
+    if server is not None:
+        server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1000,
+                        help='questions in the bank, e.g. 1000, 100000, 1000000')
+    parser.add_argument('--database-url',
+                        help='database to seed and use, a temporary SQLite '
+                             'file by default')
+    parser.add_argument('--mode', choices=['client', 'wsgi'],
+                        default='client',
+                        help='Flask test client or a real threaded WSGI '
+                             'server')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='requests in flight at once')
+    parser.add_argument('--scenario', action='append',
+                        help='only run this scenario, may be repeated')
+    parser.add_argument('--cold-start', type=int, metavar='RUNS',
+                        help='time app startup over RUNS fresh interpreters '
+                             'instead of the endpoints')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    if database_url is None:
+        database_file = os.path.join(tempfile.mkdtemp(), 'trivia-bench.db')
+        database_url = f'sqlite:///{database_file}'
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        init_db()
+        seed(args.size)
+        category_ids = [category.id for category in Category.query.all()]
+        question_ids = [row[0] for row in
+                        db.session.query(Question.id).limit(100000)]
+        counter = QueryCounter(db.engine)
+        db.session.remove()
+
+    if args.cold_start:
+        results = measure_cold_start(database_url, args.cold_start)
+        for name, result in results.items():
+            print(f"{name:24} import {result['import_ms']:9.3f} ms  "
+                  f"create_app {result['create_app_ms']:9.3f} ms")
+    else:
+        results = run_scenarios(app, args, category_ids, question_ids,
+                                counter)
+
+    report = {
+        'meta': {
+            'size': args.size,
+            'database': database_url.split(':', 1)[0],
+            'mode': 'cold-start' if args.cold_start else args.mode,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
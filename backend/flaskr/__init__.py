@@ -1,45 +1,429 @@
+import io
 import os
-from flask import Flask, request, abort, jsonify, g
+import re
+import time
+import click
+from flask import Flask, Response, request, abort, jsonify, g, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_migrate import Migrate
 import random
+from collections import Counter
 
 from sqlalchemy.sql import func
 from sqlalchemy.orm import load_only
 
-from models import setup_db, Question, Category
+from models import setup_db, init_db, bind_engines, use_read_replica, \
+                   on_write, Question, Category
+from .cache import CachedValue, LRUCache, RedisCache
+from .quiz import QuestionIdIndex, QuizSessionStore, RedisQuizSessionStore, \
+    quiz_difficulty_weights
+from .search import search_questions
+from .bulk import selection_conditions, update_values, delete_questions, \
+    update_questions
+from .importer import IMPORT_FORMATS, read_rows, import_questions
+from .suggest import PrefixIndex
+from .exporter import EXPORT_FORMATS, EXPORT_MIMETYPES, export_selection, \
+    export_chunks
+from .instrumentation import init_query_stats
+from .metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .serialization import question_rows, format_question_row, json_response
 
 QUESTIONS_PER_PAGE = 10
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+MAX_QUESTIONS_PER_CURSOR_PAGE = 100
+MAX_QUESTIONS_PER_QUIZ_DRAW = 50
+MAX_SUGGESTIONS = 20
 
 def paginate_questions(request, selection):
+  # Fetch only the requested page of an (unevaluated) questions query
 
   page = request.args.get('page', 1, type=int)
+  if page < 1:
+      return []
   start =  (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
 
-  questions = [question.format() for question in selection]
-  current_questions = questions[start:end]
+  token = question_cache.token()
+  page_selection = question_rows(selection).order_by(Question.id).\
+      offset(start).limit(QUESTIONS_PER_PAGE).all()
+  current_questions = [format_question_row(row) for row in page_selection]
+  remember_questions(current_questions, token)
   return current_questions
 
 
+def optional_int_arg(request, name):
+    # The integer query argument `name`, or None if it isn't given;
+    # a value that isn't an integer is a bad request, not a missing filter
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
 
-def categories_as_dict():
+
+def count_questions(selection):
+    # Cheap COUNT(*) of a questions query, without loading any rows
+    return selection.order_by(None).count()
+
+
+def cursor_paginate_questions(request, selection):
+    """Keyset pagination: return the questions with id greater than
+       ?after_id=<id> (at most ?limit=<n> of them) and the cursor for the
+       next page, or None once the last question has been returned.
+    """
+
+    after_id = optional_int_arg(request, 'after_id')
+    if after_id is None:
+        after_id = 0
+    limit = optional_int_arg(request, 'limit')
+    if limit is None:
+        limit = QUESTIONS_PER_PAGE
+    if limit < 1 or limit > MAX_QUESTIONS_PER_CURSOR_PAGE:
+        abort(400)
+
+    # Fetch one extra row to find out whether there is a next page
+    token = question_cache.token()
+    page_selection = question_rows(selection).filter(Question.id > after_id).\
+        order_by(Question.id).limit(limit + 1).all()
+
+    current_questions = [format_question_row(row) for row in page_selection]
+    remember_questions(current_questions, token)
+    next_cursor = None
+    if len(current_questions) > limit:
+        current_questions = current_questions[:limit]
+        next_cursor = current_questions[-1]['id']
+
+    return current_questions, next_cursor
+
+
+def load_categories():
     # Read all categories from the db and return as a dictionary
+    selection = Category.query.order_by(Category.id).all()
+    categories = {}
+    for category in selection:
+        categories[category.id] = category.type
+    return categories
+
+
+# Categories almost never change, so they are read once per process and
+# reloaded only after CATEGORY_CACHE_TTL seconds or a write to Category
+category_cache = CachedValue(load_categories)
+
+
+@on_write
+def invalidate_category_cache(model, action, instance):
+    if model is Category:
+        category_cache.invalidate()
+
+
+def load_question_index():
+    # Read the id, category and difficulty of every question into
+    # a QuestionIdIndex
+    rows = Question.query.with_entities(Question.id, Question.category,
+                                        Question.difficulty)
+    return QuestionIdIndex(rows)
+
+
+# Question ids per category and difficulty for the quiz draw, loaded once
+# and kept in step with Question writes; reloaded after QUIZ_INDEX_TTL
+# seconds to pick up writes made by other processes
+question_index = CachedValue(load_question_index)
+
+
+@on_write
+def update_question_index(model, action, instance):
+    index = question_index.peek()
+    if model is not Question or index is None:
+        return
+    if instance is None:
+        question_index.invalidate()
+        return
+    index.remove(instance.id)
+    if action != 'delete':
+        index.add(instance.id, instance.category, instance.difficulty)
+
+
+def load_question_counts():
+    # Count the questions per (category, difficulty) with one GROUP BY
+    rows = Question.query.with_entities(
+        Question.category, Question.difficulty, func.count(Question.id)).\
+        group_by(Question.category, Question.difficulty)
+    return Counter({(category_id, difficulty): count
+                    for category_id, difficulty, count in rows})
+
+
+# Question counts for /stats and /categories?with_counts=1, adjusted on
+# single inserts and deletes; reloaded after other writes, which may have
+# moved questions between categories, and after QUIZ_INDEX_TTL seconds
+question_counts = CachedValue(load_question_counts)
+
+
+@on_write
+def update_question_counts(model, action, instance):
+    counts = question_counts.peek()
+    if model is not Question or counts is None:
+        return
+    if instance is None or action not in ('insert', 'delete'):
+        question_counts.invalidate()
+        return
+    try:
+        key = (int(instance.category), int(instance.difficulty))
+    except (TypeError, ValueError):
+        question_counts.invalidate()
+        return
+    counts[key] += 1 if action == 'insert' else -1
+
+
+def question_stats():
+    """Return the number of questions in total, per category and per
+       difficulty, and per difficulty within each category. Questions
+       without a known category are counted as uncategorized, so the
+       categories add up to the total.
+    """
+
+    categories = categories_as_dict()
+    per_category = {category_id: {'type': category_type,
+                                  'total_questions': 0,
+                                  'difficulties': {}}
+                    for category_id, category_type in categories.items()}
+    uncategorized = {'total_questions': 0, 'difficulties': Counter()}
+    per_difficulty = Counter()
+    for (category_id, difficulty), count in question_counts.get().items():
+        if count <= 0:
+            continue
+        per_difficulty[difficulty] += count
+        stats = per_category.get(category_id)
+        if stats is not None:
+            stats['total_questions'] += count
+            stats['difficulties'][difficulty] = count
+        else:
+            uncategorized['total_questions'] += count
+            uncategorized['difficulties'][difficulty] += count
+    uncategorized['difficulties'] = dict(uncategorized['difficulties'])
+    return {'total_questions': sum(per_difficulty.values()),
+            'categories': per_category,
+            'uncategorized': uncategorized,
+            'difficulties': dict(per_difficulty)}
+
+
+def load_suggest_index():
+    """Build the search suggestion index from the snapshot file given by
+       SUGGEST_INDEX_PATH the first time, from the question texts after.
+    """
+
+    global suggest_snapshot_path
+    path, suggest_snapshot_path = suggest_snapshot_path, None
+    if path is not None and os.path.exists(path):
+        return PrefixIndex.load(path, suggest_max_terms)
+    texts = Question.query.with_entities(Question.question).yield_per(10000)
+    return PrefixIndex.from_texts((text for text, in texts),
+                                  suggest_max_terms)
+
+
+# Words of the question texts for /questions/suggest, kept in step with
+# single inserts and deletes; reloaded after other writes, whose old texts
+# aren't known, and after SUGGEST_INDEX_TTL seconds
+suggest_index = CachedValue(load_suggest_index)
+suggest_snapshot_path = None
+suggest_max_terms = 100000
+
+
+def configure_suggest_index(config):
+    global suggest_snapshot_path, suggest_max_terms
+    suggest_snapshot_path = config['SUGGEST_INDEX_PATH']
+    suggest_max_terms = config['SUGGEST_MAX_TERMS']
+    suggest_index.ttl = config['SUGGEST_INDEX_TTL']
+    suggest_index.invalidate()
+
+
+@on_write
+def update_suggest_index(model, action, instance):
+    index = suggest_index.peek()
+    if model is not Question or index is None:
+        return
+    if instance is None or action not in ('insert', 'delete'):
+        suggest_index.invalidate()
+    elif action == 'insert':
+        index.add_text(instance.question)
+    else:
+        index.remove_text(instance.question)
+
+
+def suggestions(search_term, limit):
+    # Complete the last word of the search term with the most common words
+    match = re.search(r'\w+$', search_term)
+    if match is None:
+        return []
+    head = search_term[:match.start()]
+    return [head + term for term, _ in
+            suggest_index.get().complete(match.group(), limit)]
+
+
+# Serialized listing responses keyed by (route, category id, page),
+# dropped on every write; the backend is chosen by create_app
+response_cache = None
+
+
+def configure_response_cache(config):
+    global response_cache
+    backend = config['RESPONSE_CACHE']
+    if backend == 'memory':
+        response_cache = LRUCache(max_entries=config['RESPONSE_CACHE_SIZE'],
+                                  ttl=config['RESPONSE_CACHE_TTL'])
+    elif backend == 'redis':
+        response_cache = RedisCache(config['RESPONSE_CACHE_REDIS_URL'],
+                                    ttl=config['RESPONSE_CACHE_TTL'])
+    else:
+        response_cache = None
+
+
+def create_quiz_session_store(config):
+    backend = config['QUIZ_SESSIONS']
+    if backend == 'memory':
+        return QuizSessionStore(max_sessions=config['MAX_QUIZ_SESSIONS'],
+                                ttl=config['QUIZ_SESSION_TTL'])
+    if backend == 'redis':
+        return RedisQuizSessionStore(config['QUIZ_SESSIONS_REDIS_URL'],
+                                     ttl=config['QUIZ_SESSION_TTL'])
+    raise ValueError(f'unknown QUIZ_SESSIONS backend {backend!r}')
+
+
+@on_write
+def invalidate_response_cache(model, action, instance):
+    if response_cache is not None:
+        response_cache.clear()
+
+
+def cached_response(key, build_response):
+    """Return the cached response body for key, or build the response
+       and cache its body if it is a 200.
+    """
+
+    if response_cache is None:
+        return build_response()
+
+    body = response_cache.get(key)
+    if body is not None:
+        return Response(body, mimetype='application/json')
+
+    token = response_cache.token()
+    response = build_response()
+    if response.status_code == 200:
+        response_cache.set(key, response.get_data(), token)
+    return response
+
+
+# Formatted questions by id, for the quiz draw and single question reads;
+# an entry is dropped when its question is updated or deleted, and all of
+# them on bulk writes
+question_cache = LRUCache()
+
+
+@on_write
+def invalidate_question_cache(model, action, instance):
+    if model is not Question:
+        return
+    if instance is None:
+        question_cache.clear()
+    elif action != 'insert':
+        question_cache.delete(instance.id)
+
+
+def remember_questions(questions, token):
+    # Cache formatted questions read by a query started at `token`
+    question_cache.set_many({question['id']: question
+                             for question in questions}, token)
+
+
+def get_questions(question_ids):
+    """Return {id: formatted question} for those of the ids that exist,
+       reading the ones that aren't cached with a single query.
+    """
+
+    found = question_cache.get_many(question_ids)
+    missing = [question_id for question_id in question_ids
+               if question_id not in found]
+    if missing:
+        token = question_cache.token()
+        rows = question_rows(Question.query).\
+            filter(Question.id.in_(missing)).all()
+        questions = [format_question_row(row) for row in rows]
+        remember_questions(questions, token)
+        found.update((question['id'], question) for question in questions)
+    return found
+
+
+def draw_quiz_questions(category_id, previous_questions, count=1,
+                        category_weights=None, difficulty_weights=None,
+                        ramp_length=None):
+    """Return up to `count` distinct random questions, formatted, from the
+       given category (0 for all categories) whose ids are not in the
+       previous_questions set; an empty list if there is none left.
+       category_weights ({category id: weight}) draws from several
+       categories instead, difficulty_weights ({difficulty: weight})
+       favours some difficulties over others and ramp_length moves the
+       favoured difficulty from easy to hard over a quiz of that length.
+    """
+
+    index = question_index.get()
+    weighted = (category_weights is not None or difficulty_weights is not None
+                or ramp_length is not None)
+    if category_weights is None:
+        category_weights = {category_id: 1}
+
+    drawn_ids = []
+    excluded = set(previous_questions)
+    questions = []
+    while len(questions) < count:
+        # Draw the missing ids from memory, then read the uncached ones
+        # in one query
+        new_ids = []
+        while len(questions) + len(new_ids) < count:
+            if weighted:
+                played = len(previous_questions) + len(drawn_ids)
+                question_id = index.draw_weighted(
+                    category_weights,
+                    quiz_difficulty_weights(played, difficulty_weights,
+                                            ramp_length),
+                    excluded)
+            else:
+                question_id = index.draw(category_id, excluded)
+            if question_id is None:
+                break
+            excluded.add(question_id)
+            drawn_ids.append(question_id)
+            new_ids.append(question_id)
+        if not new_ids:
+            break
+
+        found = get_questions(new_ids)
+        for question_id in new_ids:
+            if question_id in found:
+                questions.append(found[question_id])
+            else:
+                # Deleted by another process since the index was loaded
+                index.remove(question_id)
+    return questions
+
+
+def categories_as_dict():
+    # Return the cached categories dictionary
     try:
-        selection = Category.query.order_by(Category.id).all()
-        categories = {}
-        for category in selection:
-            categories[category.id] = category.type
-        return categories
+        return category_cache.get()
     except:
         abort(404)
 
-def paginated_questions(request):
+def paginated_questions(request, selection=None):
     # Return paginated questions and total_questions_count
 
     try:
-        selection = Question.query.order_by(Question.id).all()
-        total_questions_count = len(selection)
+        if selection is None:
+            selection = Question.query
+        total_questions_count = count_questions(selection)
         current_questions = paginate_questions(request, selection)
 
         if len(current_questions) == 0:
@@ -49,6 +433,16 @@ def paginated_questions(request):
     except:
         abort(404)
 
+def parse_weights(weights):
+    # Turn a {"id": weight} JSON object into {int id: float weight}
+    if not isinstance(weights, dict):
+        raise ValueError('weights must be an object')
+    parsed = {int(key): float(weight) for key, weight in weights.items()}
+    if any(weight < 0 for weight in parsed.values()):
+        raise ValueError('weights must not be negative')
+    return parsed
+
+
 def request_matter(request):
     """Determines if the POST request to '/questions'
        is for search or for adding a new question.
@@ -72,6 +466,26 @@ def request_matter(request):
     else:
         abort(400)
 
+def wants_minimal_response(request):
+    """True if the client asked for a lean write response with
+       ?return=minimal or a 'Prefer: return=minimal' header.
+    """
+
+    if request.args.get('return') == 'minimal':
+        return True
+    preferences = request.headers.get('Prefer', '').split(',')
+    return 'return=minimal' in (p.strip() for p in preferences)
+
+
+def minimal_response(result):
+    # The write result plus the new total, without a page of questions
+    result['success'] = True
+    result['total_questions'] = count_questions(Question.query)
+    response = jsonify(result)
+    response.headers['Preference-Applied'] = 'return=minimal'
+    return response
+
+
 def add_new_question(request):
     # add new question to the database
     body = request.get_json()
@@ -91,6 +505,8 @@ def add_new_question(request):
                             category=new_category)
         question.insert()
 
+        if wants_minimal_response(request):
+            return minimal_response({'created': question.id})
 
         current_questions, total_questions_count = paginated_questions(request)
         categories = categories_as_dict()
@@ -110,19 +526,21 @@ def add_new_question(request):
 
 
 def found_questions(request):
-    # Retrieve questions from th db that match the search term,
-    # paginate found questions and return
+    # Retrieve the page of questions that best match the search term
+    # from the full-text index and return
+    use_read_replica()
 
     try:
         body = request.get_json()
         search_term = body.get('searchTerm', None)
+        include_answers = bool(body.get('searchAnswers', False))
+        page = max(request.args.get('page', 1, type=int), 1)
 
-        selection = Question.query.filter(
-                        Question.question.ilike(f'%{search_term}%')).all()
-        total_questions_count = len(selection)
+        found, total_questions_count = search_questions(
+            search_term, include_answers, page, QUESTIONS_PER_PAGE)
 
-        current_questions = paginate_questions(request, selection)
-        return jsonify({
+        current_questions = [format_question_row(row) for row in found]
+        return json_response({
                         'success': True,
                         'questions': current_questions,
                         'total_questions': total_questions_count,
@@ -136,7 +554,61 @@ def found_questions(request):
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    db = setup_db(app)
+    app.config.from_mapping(
+        CATEGORY_CACHE_TTL=300,
+        QUIZ_INDEX_TTL=300,
+        QUIZ_SESSION_LENGTH=50,
+        QUIZ_SESSION_TTL=3600,
+        MAX_QUIZ_SESSIONS=10000,
+        QUIZ_SESSIONS='memory',
+        QUIZ_SESSIONS_REDIS_URL='redis://localhost:6379/0',
+        IMPORT_BATCH_SIZE=1000,
+        QUERY_STATS=False,
+        QUERY_BUDGET=None,
+        QUERY_BUDGETS={},
+        METRICS=True,
+        RESPONSE_CACHE='memory',
+        RESPONSE_CACHE_SIZE=1024,
+        RESPONSE_CACHE_TTL=60,
+        RESPONSE_CACHE_REDIS_URL='redis://localhost:6379/0',
+        QUESTION_CACHE_SIZE=10000,
+        QUESTION_CACHE_TTL=300,
+        SUGGEST_INDEX_PATH=None,
+        SUGGEST_INDEX_TTL=3600,
+        SUGGEST_MAX_TERMS=100000,
+        INIT_DB=False,
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    # Nothing here connects to the database, so workers start without it;
+    # the schema is made by `flask init-db` (or INIT_DB for throwaway ones)
+    db = setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI'))
+    Migrate(app, db, directory=MIGRATIONS_DIRECTORY)
+    with app.app_context():
+        init_query_stats(app, bind_engines().values())
+        if app.config['INIT_DB']:
+            init_db()
+
+    category_cache.ttl = app.config['CATEGORY_CACHE_TTL']
+    category_cache.invalidate()
+    question_index.ttl = app.config['QUIZ_INDEX_TTL']
+    question_index.invalidate()
+    question_counts.ttl = app.config['QUIZ_INDEX_TTL']
+    question_counts.invalidate()
+    question_cache.max_entries = app.config['QUESTION_CACHE_SIZE']
+    question_cache.ttl = app.config['QUESTION_CACHE_TTL']
+    question_cache.clear()
+    configure_response_cache(app.config)
+    configure_suggest_index(app.config)
+    if suggest_snapshot_path is not None and \
+       os.path.exists(suggest_snapshot_path):
+        # Reading the snapshot doesn't touch the database
+        suggest_index.get()
+
+    quiz_sessions = create_quiz_session_store(app.config)
+
+    metrics = Metrics()
 
     '''
     @DONE: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -146,34 +618,46 @@ def create_app(test_config=None):
     '''
     @DONE: Use the after_request decorator to set Access-Control-Allow
     '''
+    @app.before_request
+    def start_timer():
+        g.request_start_time = time.perf_counter()
+
     # CORS Headers
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PATCH,POST,DELETE,OPTIONS')
-        return response
-
 
-    def questions_id_list(category_id=0):
-        """
-        Return list of IDs of Questions.
-        If given category id is 0 then IDs of all questions will be returned.
-        If another category id is given the IDs of questins in the given
-        category will be returned
-        """
-
-        if category_id == 0:
-            questions_ids = db.session.query(Question.id).all()
-        else:
-            questions_ids = db.session.query(Question.id).\
-            filter(Question.category==category_id).all()
+        start_time = g.get('request_start_time')
+        if app.config['METRICS'] and start_time is not None:
+            # Label by URL rule, not path, to keep the number of series bounded
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe_request(request.method, route,
+                                    response.status_code,
+                                    time.perf_counter() - start_time)
+        return response
 
+    '''
+    Prometheus metrics: requests, latencies and errors per route,
+    database pool usage and cache hit rates.
+    '''
 
-        questions_id_list = []
+    @app.route('/metrics')
+    def retrieve_metrics():
+        if not app.config['METRICS']:
+            abort(404)
+        caches = {'categories': category_cache,
+                  'quiz_index': question_index,
+                  'question_counts': question_counts,
+                  'suggest_index': suggest_index,
+                  'questions': question_cache}
+        if response_cache is not None:
+            caches['responses'] = response_cache
+        pools = {bind: engine.pool
+                 for bind, engine in bind_engines().items()}
+        return Response(metrics.render(pools, caches),
+                        content_type=METRICS_CONTENT_TYPE)
 
-        for id in questions_ids:
-            questions_id_list.append(id[0])
-        return questions_id_list
 
     '''
     @TODO:
@@ -182,12 +666,33 @@ def create_app(test_config=None):
     '''
     @app.route('/categories')
     def retrieve_categories():
+        use_read_replica()
         categories = categories_as_dict()
-        return jsonify({
+        result = {
             'success': True,
             'categories': categories,
             'total_categories': len(categories)
-         })
+         }
+        if request.args.get('with_counts', '0') not in ('', '0', 'false'):
+            stats = question_stats()
+            result['category_counts'] = {
+                category_id: category_stats['total_questions']
+                for category_id, category_stats in stats['categories'].items()}
+            result['uncategorized_count'] = \
+                stats['uncategorized']['total_questions']
+            result['difficulty_counts'] = stats['difficulties']
+            result['total_questions'] = stats['total_questions']
+        response = jsonify(result)
+        # Let browsers revalidate with If-None-Match and get a 304
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route('/stats')
+    def retrieve_stats():
+        use_read_replica()
+        stats = question_stats()
+        stats['success'] = True
+        return jsonify(stats)
 
     '''
     @TODO:
@@ -204,16 +709,42 @@ def create_app(test_config=None):
 
     @app.route('/questions')
     def retrieve_questions():
-        current_questions, total_questions_count  = paginated_questions(request)
-        categories = categories_as_dict()
+        use_read_replica()
+        if 'after_id' in request.args:
+            current_questions, next_cursor = \
+                cursor_paginate_questions(request, Question.query)
+            return json_response({
+                            'success': True,
+                            'questions': current_questions,
+                            'next_cursor': next_cursor,
+                            'categories': categories_as_dict()
+                            })
 
-        return jsonify({
-                        'success': True,
-                        'questions': current_questions,
-                        'total_questions': total_questions_count,
-                        'categories': categories
-                        })
+        def build_response():
+            current_questions, total_questions_count  = paginated_questions(request)
+            categories = categories_as_dict()
+
+            return json_response({
+                            'success': True,
+                            'questions': current_questions,
+                            'total_questions': total_questions_count,
+                            'categories': categories
+                            })
 
+        page = request.args.get('page', 1, type=int)
+        return cached_response(('questions', 0, page), build_response)
+
+
+    @app.route('/questions/<int:question_id>')
+    def retrieve_question(question_id):
+        use_read_replica()
+        question = get_questions([question_id]).get(question_id)
+        if question is None:
+            abort(404)
+
+        return jsonify({'success': True,
+                        'question': question,
+                        })
 
 
     '''
@@ -234,6 +765,9 @@ def create_app(test_config=None):
         except:
             abort(422)
 
+        if wants_minimal_response(request):
+            return minimal_response({'deleted': question_id})
+
         current_questions, total_questions_count = paginated_questions(request)
         categories = categories_as_dict()
 
@@ -246,6 +780,47 @@ def create_app(test_config=None):
             })
 
 
+    '''
+    Bulk deletes and updates select questions by a list of ids and/or
+    category, difficulty and search term, and run as one statement.
+    '''
+
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_in_bulk():
+        body = request.get_json()
+        try:
+            conditions = selection_conditions(body)
+        except:
+            abort(400)
+
+        try:
+            deleted = delete_questions(conditions)
+        except:
+            abort(422)
+
+        return jsonify({'success': True,
+                        'deleted': deleted,
+                        })
+
+    @app.route('/questions', methods=['PATCH'])
+    def update_questions_in_bulk():
+        body = request.get_json()
+        try:
+            conditions = selection_conditions(body)
+            values = update_values(body.get('set'), categories_as_dict())
+        except:
+            abort(400)
+
+        try:
+            updated = update_questions(conditions, values)
+        except:
+            abort(422)
+
+        return jsonify({'success': True,
+                        'updated': updated,
+                        })
+
+
     '''
     @TODO:
     Create an endpoint to POST a new question,
@@ -269,6 +844,128 @@ def create_app(test_config=None):
             return found_questions(request)
 
 
+    '''
+    Bulk import of questions from JSONL (one JSON object per line) or CSV
+    with question, answer, difficulty and category fields.
+    Rows are committed in batches and invalid rows are reported, not fatal.
+    '''
+
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_import_questions():
+        format = request.args.get('format')
+        if format is None:
+            format = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+        batch_size = request.args.get('batch_size',
+                                      app.config['IMPORT_BATCH_SIZE'], type=int)
+        if format not in IMPORT_FORMATS or batch_size < 1:
+            abort(400)
+
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8',
+                                  errors='surrogateescape', newline='')
+        report = import_questions(read_rows(stream, format),
+                                  categories_as_dict(), batch_size)
+
+        return jsonify({'success': True,
+                        'imported': report['imported'],
+                        'error_count': report['error_count'],
+                        'errors': report['errors'],
+                        })
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the missing tables and the full-text search index."""
+        init_db()
+        click.echo('Initialized the database.')
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', type=click.Choice(IMPORT_FORMATS),
+                  help='File format, taken from the extension by default.')
+    @click.option('--batch-size', type=int,
+                  help='Rows per transaction, IMPORT_BATCH_SIZE by default.')
+    def import_questions_command(path, format, batch_size):
+        """Import questions from a JSONL or CSV file."""
+
+        if format is None:
+            format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        if batch_size is None:
+            batch_size = app.config['IMPORT_BATCH_SIZE']
+
+        with open(path, encoding='utf-8', errors='surrogateescape',
+                  newline='') as stream:
+            report = import_questions(read_rows(stream, format),
+                                      categories_as_dict(), batch_size)
+
+        click.echo(f"Imported {report['imported']} questions, "
+                   f"{report['error_count']} rows failed")
+        for error in report['errors']:
+            click.echo(f"row {error['row']}: {error['error']}")
+
+    '''
+    Search suggestions complete the last word typed from an in-memory
+    index of the words of all questions.
+    '''
+
+    @app.route('/questions/suggest')
+    def suggest_questions():
+        use_read_replica()
+        limit = request.args.get('limit', 10, type=int)
+        if not 1 <= limit <= MAX_SUGGESTIONS:
+            abort(400)
+
+        return jsonify({'success': True,
+                        'suggestions': suggestions(request.args.get('q', ''),
+                                                   limit),
+                        })
+
+    @app.cli.command('build-suggest-index')
+    @click.argument('path', required=False)
+    def build_suggest_index_command(path):
+        """Write a snapshot of the suggestion index for SUGGEST_INDEX_PATH."""
+
+        path = path or app.config['SUGGEST_INDEX_PATH']
+        if path is None:
+            raise click.UsageError('Give a path or set SUGGEST_INDEX_PATH.')
+        configure_suggest_index(dict(app.config, SUGGEST_INDEX_PATH=None))
+        index = suggest_index.get()
+        index.save(path)
+        click.echo(f'Wrote {len(index)} words to {path}.')
+
+    '''
+    Export of the whole question bank (or one category and/or difficulty)
+    as NDJSON or CSV, streamed from a server-side cursor in constant memory.
+    '''
+
+    @app.route('/questions/export')
+    def export_questions():
+        use_read_replica()
+        format = request.args.get('format', 'ndjson')
+        if format not in EXPORT_FORMATS:
+            abort(400)
+        selection = export_selection(optional_int_arg(request, 'category'),
+                                     optional_int_arg(request, 'difficulty'))
+
+        return Response(stream_with_context(export_chunks(selection, format)),
+                        mimetype=EXPORT_MIMETYPES[format])
+
+    @app.cli.command('export-questions')
+    @click.argument('path', default='-')
+    @click.option('--format', type=click.Choice(EXPORT_FORMATS),
+                  help='File format, taken from the extension by default.')
+    @click.option('--category', type=int, help='Only export this category.')
+    @click.option('--difficulty', type=int,
+                  help='Only export this difficulty.')
+    def export_questions_command(path, format, category, difficulty):
+        """Export questions as NDJSON or CSV to a file or stdout."""
+
+        if format is None:
+            format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+        with click.open_file(path, 'wb') as output:
+            for chunk in export_chunks(export_selection(category, difficulty),
+                                       format):
+                output.write(chunk)
+
     '''
     @TODO:
     Create a POST endpoint to get questions based on a search term.
@@ -295,16 +992,33 @@ def create_app(test_config=None):
 
     @app.route('/categories/<int:category_id>/questions')
     def get_category_questions(category_id):
-        selection = Question.query.filter_by(category=category_id).all()
-        total_questions_count = len(selection)
-        current_questions = paginate_questions(request, selection)
+        use_read_replica()
+        selection = Question.query.filter_by(category=category_id)
+
+        if 'after_id' in request.args:
+            current_questions, next_cursor = \
+                cursor_paginate_questions(request, selection)
+            return json_response({
+                            'success': True,
+                            'questions': current_questions,
+                            'next_cursor': next_cursor,
+                            'current_category': category_id
+                            })
 
-        return jsonify({
-                        'success': True,
-                        'questions': current_questions,
-                        'total_questions': total_questions_count,
-                        'current_category': category_id
-                        })
+        def build_response():
+            total_questions_count = count_questions(selection)
+            current_questions = paginate_questions(request, selection)
+
+            return json_response({
+                            'success': True,
+                            'questions': current_questions,
+                            'total_questions': total_questions_count,
+                            'current_category': category_id
+                            })
+
+        page = request.args.get('page', 1, type=int)
+        return cached_response(('category_questions', category_id, page),
+                               build_response)
 
 
     '''
@@ -321,33 +1035,87 @@ def create_app(test_config=None):
 
     @app.route('/quizzes', methods=['POST'])
     def play_the_quiz():
+        use_read_replica()
         body = request.get_json()
         #print(body)
         try:
             quiz_category_dict = body['quiz_category']
             quiz_category_id = int(quiz_category_dict['id'])
-            previous_questions = body['previous_questions']
+            previous_questions = set(body['previous_questions'])
+            # Optional weighting of the draw, see the README
+            category_weights = body.get('category_weights')
+            if category_weights is not None:
+                category_weights = parse_weights(category_weights)
+            difficulty_weights = body.get('difficulty_weights')
+            if difficulty_weights is not None:
+                difficulty_weights = parse_weights(difficulty_weights)
+            ramp_length = body.get('difficulty_ramp')
+            if ramp_length is not None:
+                ramp_length = int(ramp_length)
+            count = int(body.get('count', 1))
+            if not 1 <= count <= MAX_QUESTIONS_PER_QUIZ_DRAW:
+                raise ValueError('count out of range')
         except:
             abort(400)
-        questions_ids = questions_id_list(quiz_category_id)
-
-        for previous_question in previous_questions:
-            try:
-                questions_ids.remove(previous_question)
-            except:
-                pass
 
         try:
-            rand_question_id = random.choice(questions_ids)
+            questions = draw_quiz_questions(
+                quiz_category_id, previous_questions, count,
+                category_weights, difficulty_weights, ramp_length)
+        except:
+            abort(422)
+        if not questions:
+            abort(422)
 
-            question = Question.query.get(rand_question_id)
+        result = {'success': True,
+                  'question': questions[0],
+                  }
+        if 'count' in body:
+            result['questions'] = questions
+        return jsonify(result)
 
-            question = question.format()
-            return jsonify({'success': True,
-                            'question': question,
-                            })
+    '''
+    Quiz sessions keep a shuffled list of question ids on the server,
+    so clients don't have to send previous_questions with every draw.
+    '''
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz_session():
+        use_read_replica()
+        body = request.get_json()
+        try:
+            quiz_category_id = int(body['quiz_category']['id'])
         except:
-            abort(422)
+            abort(400)
+
+        question_ids = question_index.get().sample(
+            quiz_category_id, app.config['QUIZ_SESSION_LENGTH'])
+        session_id = quiz_sessions.create(question_ids)
+
+        return jsonify({'success': True,
+                        'session_id': session_id,
+                        'total_questions': len(question_ids),
+                        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        use_read_replica()
+        while True:
+            try:
+                question_id = quiz_sessions.next_id(session_id)
+            except KeyError:
+                abort(404)
+            if question_id is None:
+                # The frontend ends the quiz when no question is returned
+                return jsonify({'success': True,
+                                'question': None,
+                                })
+
+            question = get_questions([question_id]).get(question_id)
+            if question is not None:
+                return jsonify({'success': True,
+                                'question': question,
+                                })
 
 
     '''
@@ -358,6 +1126,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(404)
     def not_found(error):
+      metrics.count_error(404)
       return jsonify({
         "success": False,
         "error": 404,
@@ -366,6 +1135,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(422)
     def unprocessable(error):
+      metrics.count_error(422)
       return jsonify({
         "success": False,
         "error": 422,
@@ -374,6 +1144,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(400)
     def bad_request(error):
+      metrics.count_error(400)
       return jsonify({
         "success": False,
         "error": 400,
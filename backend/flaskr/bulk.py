@@ -0,0 +1,86 @@
+import re
+
+from models import db, notify_write, Question
+from .search import search_condition
+
+# Columns PATCH /questions may set on every selected question
+UPDATABLE_FIELDS = ('category', 'difficulty')
+
+
+def selection_conditions(body):
+    """Return the filters on Question given in a bulk request body:
+       a list of `ids` and/or `category`, `difficulty` and `searchTerm`
+       (with `searchAnswers`). Raise ValueError if there is none, so a
+       malformed request can't select every question.
+    """
+
+    conditions = []
+    if 'ids' in body:
+        ids = body['ids']
+        if not isinstance(ids, list) or not ids:
+            raise ValueError('ids must be a non-empty list')
+        conditions.append(Question.id.in_([int(question_id)
+                                           for question_id in ids]))
+    if body.get('category') is not None:
+        conditions.append(Question.category == int(body['category']))
+    if body.get('difficulty') is not None:
+        conditions.append(Question.difficulty == int(body['difficulty']))
+    search_term = body.get('searchTerm')
+    if search_term:
+        # A term without words would be a substring search, and one like
+        # "%" mustn't be able to select a lot more than intended
+        if not re.search(r'\w', search_term):
+            raise ValueError('searchTerm must contain a word')
+        conditions.append(search_condition(
+            search_term, bool(body.get('searchAnswers'))))
+
+    if not conditions:
+        raise ValueError('no questions selected')
+    return conditions
+
+
+def update_values(changes, category_ids):
+    # Return the validated column values to set, raise ValueError if invalid
+
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('set must be a non-empty object')
+    unknown = set(changes) - set(UPDATABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"can't update {', '.join(sorted(unknown))}")
+
+    values = {field: int(value) for field, value in changes.items()}
+    if 'difficulty' in values and not 1 <= values['difficulty'] <= 5:
+        raise ValueError('difficulty must be between 1 and 5')
+    if 'category' in values and values['category'] not in category_ids:
+        raise ValueError('unknown category')
+    return values
+
+
+def delete_questions(conditions):
+    # Delete the selected questions with one statement, return their number
+    try:
+        deleted = Question.query.filter(*conditions).\
+            delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if deleted:
+        notify_write(Question, 'delete')
+    return deleted
+
+
+def update_questions(conditions, values):
+    # Update the selected questions with one statement, return their number
+    try:
+        updated = Question.query.filter(*conditions).\
+            update(values, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if updated:
+        notify_write(Question, 'update')
+    return updated
@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class CachedValue:
+    """A single value loaded on first use and kept for `ttl` seconds,
+       or until invalidate() is called.
+    """
+
+    def __init__(self, loader, ttl=300):
+        self.loader = loader
+        self.ttl = ttl
+        self._entry = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Counted without the lock, so they may miss a few concurrent lookups
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        with self._lock:
+            generation = self._generation
+        value = self.loader()
+
+        with self._lock:
+            # Don't store a value that was invalidated while it was loading
+            if generation == self._generation:
+                self._entry = (value, time.monotonic() + self.ttl)
+        return value
+
+    def peek(self):
+        # Return the cached value without loading it, or None
+        entry = self._entry
+        if entry is None:
+            return None
+        return entry[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entry = None
+
+
+class LRUCache:
+    """In-process cache of up to `max_entries` values, each kept for `ttl`
+       seconds; the least recently used entry is dropped first.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_many(self, keys):
+        # Return {key: value} for the keys that are cached
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or now >= entry[1]:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[0]
+        return found
+
+    def token(self):
+        # Pass to set() to skip storing values computed before a clear()
+        # or delete()
+        return self._generation
+
+    def set(self, key, value, token=None):
+        self.set_many({key: value}, token)
+
+    def set_many(self, items, token=None):
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            expires = time.monotonic() + self.ttl
+            for key, value in items.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class RedisCache:
+    """Cache shared by all processes, kept in one Redis (or compatible
+       server) hash that expires `ttl` seconds after the last write.
+       Needs the optional redis package.
+    """
+
+    def __init__(self, url, ttl=60, name='trivia:responses'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        return repr(key)
+
+    def get(self, key):
+        value = self._redis.hget(self.name, self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def token(self):
+        return None
+
+    def set(self, key, value, token=None):
+        pipeline = self._redis.pipeline()
+        pipeline.hset(self.name, self._key(key), value)
+        pipeline.expire(self.name, self.ttl)
+        pipeline.execute()
+
+    def clear(self):
+        self._redis.delete(self.name)
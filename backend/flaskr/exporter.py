@@ -0,0 +1,52 @@
+import io
+import csv
+
+from models import Question
+from .serialization import (QUESTION_FIELDS, question_rows,
+                            format_question_row, dumps)
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Rows fetched from the server-side cursor, and written, at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_selection(category=None, difficulty=None):
+    """Return a query over the columns of all questions, optionally of one
+       category and difficulty, that streams its rows from a server-side
+       cursor in batches instead of loading them all.
+    """
+
+    selection = Question.query
+    if category is not None:
+        selection = selection.filter(Question.category == category)
+    if difficulty is not None:
+        selection = selection.filter(Question.difficulty == difficulty)
+    return question_rows(selection).order_by(Question.id).\
+        execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+
+
+def export_chunks(rows, format):
+    # Yield the rows encoded as NDJSON or CSV, EXPORT_BATCH_SIZE rows a chunk
+
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(QUESTION_FIELDS)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(dumps(format_question_row(row)))
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield b'\n'.join(lines) + b'\n'
+            lines = []
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
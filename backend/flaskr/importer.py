@@ -0,0 +1,139 @@
+import csv
+import json
+
+from models import db, notify_write, Question
+
+IMPORT_FORMATS = ('jsonl', 'csv')
+# Errors listed in an import report, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def read_rows(stream, format):
+    """Yield (row number, row) for every record of a JSONL or CSV text
+       stream; row is the exception if the record can't be parsed.
+       The stream should decode with errors='surrogateescape', so that
+       bytes that aren't UTF-8 only spoil the record they are in.
+    """
+
+    if format == 'csv':
+        yield from read_csv_rows(stream)
+        return
+
+    for row_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            check_utf8(line)
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+
+def read_csv_rows(stream):
+    reader = csv.DictReader(stream)
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            row = next(reader)
+            for value in row.values():
+                if isinstance(value, str):
+                    check_utf8(value)
+        except StopIteration:
+            return
+        except (csv.Error, ValueError) as e:
+            # The reader goes on with the next line
+            yield row_number, e
+            continue
+        yield row_number, row
+
+
+def check_utf8(text):
+    # Undecodable bytes were turned into lone surrogates
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        raise ValueError('not valid UTF-8')
+
+
+def validate_row(row, category_ids):
+    # Return the column values of a question row, raise ValueError if invalid
+
+    if isinstance(row, Exception):
+        raise ValueError(f'invalid record: {row}')
+    if not isinstance(row, dict):
+        raise ValueError('record is not an object')
+
+    values = {}
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'missing {field}')
+        values[field] = value
+
+    for field in ('difficulty', 'category'):
+        try:
+            values[field] = int(row.get(field))
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be an integer')
+
+    if not 1 <= values['difficulty'] <= 5:
+        raise ValueError('difficulty must be between 1 and 5')
+    if values['category'] not in category_ids:
+        raise ValueError('unknown category')
+    return values
+
+
+def insert_batch(batch, report):
+    """Insert a batch of (row number, values) in one transaction.
+       If that fails, insert the rows one by one to find the bad ones.
+    """
+
+    try:
+        db.session.bulk_insert_mappings(Question, [values for _, values in batch])
+        db.session.commit()
+        report['imported'] += len(batch)
+        return
+    except Exception:
+        db.session.rollback()
+
+    for row_number, values in batch:
+        try:
+            db.session.bulk_insert_mappings(Question, [values])
+            db.session.commit()
+            report['imported'] += 1
+        except Exception as e:
+            db.session.rollback()
+            add_error(report, row_number, str(e.__cause__ or e))
+
+
+def add_error(report, row_number, message):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': row_number, 'error': message})
+
+
+def import_questions(rows, category_ids, batch_size):
+    """Validate and insert (row number, row) pairs, committing once per
+       batch_size rows. Invalid rows are reported and skipped.
+    """
+
+    report = {'imported': 0, 'error_count': 0, 'errors': []}
+    batch = []
+    for row_number, row in rows:
+        try:
+            batch.append((row_number, validate_row(row, category_ids)))
+        except ValueError as e:
+            add_error(report, row_number, str(e))
+            continue
+
+        if len(batch) >= batch_size:
+            insert_batch(batch, report)
+            batch = []
+
+    if batch:
+        insert_batch(batch, report)
+
+    if report['imported']:
+        notify_write(Question, 'insert')
+    return report
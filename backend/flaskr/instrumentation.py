@@ -0,0 +1,100 @@
+import json
+import time
+import logging
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+logger = logging.getLogger('flaskr.query_stats')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    # SQL statements run while handling one request
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows_affected = 0
+
+
+def rows_affected(cursor, context):
+    """The rows written by a statement. The rowcount of a SELECT isn't the
+       number of rows it returns (sqlite3 and server-side cursors report -1),
+       so reads count for nothing.
+    """
+
+    writes = context is not None and \
+        (context.isinsert or context.isupdate or context.isdelete)
+    if cursor.description is not None and not writes:
+        return 0
+    # Drivers that can't tell the number of rows report -1
+    return max(cursor.rowcount, 0)
+
+
+def init_query_stats(app, engines):
+    """Count the queries, database time and rows written of every request
+       when QUERY_STATS is set, on all the given engines, and report them in
+       a Server-Timing header and a JSON log line on the 'flaskr.query_stats'
+       logger.
+       Requests running more queries than QUERY_BUDGETS[endpoint] (or
+       QUERY_BUDGET) are logged, or raise QueryBudgetExceeded when testing.
+    """
+
+    if not app.config['QUERY_STATS']:
+        return
+
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start_times'].pop()
+        if not has_request_context():
+            return
+        stats = g.get('query_stats')
+        if stats is None:
+            return
+        stats.count += 1
+        stats.duration += duration
+        stats.rows_affected += rows_affected(cursor, context)
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', start_query)
+        event.listen(engine, 'after_cursor_execute', end_query)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        duration_ms = round(stats.duration * 1000, 3)
+        response.headers['Server-Timing'] = (
+            f'db;dur={duration_ms};desc="{stats.count} queries, '
+            f'{stats.rows_affected} rows affected"')
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_time_ms': duration_ms,
+            'rows_affected': stats.rows_affected,
+        }))
+
+        budget = app.config['QUERY_BUDGETS'].get(request.endpoint,
+                                                 app.config['QUERY_BUDGET'])
+        if budget is not None and stats.count > budget:
+            message = (f'{request.method} {request.path} ran {stats.count} '
+                       f'queries, the budget is {budget}')
+            if app.testing:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
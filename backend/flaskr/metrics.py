@@ -0,0 +1,124 @@
+import bisect
+import threading
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').\
+        replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in values.items()) + '}'
+
+
+class Metrics:
+    """Request counters and latency histograms of one app, rendered in the
+       Prometheus text format. Every observation takes one short lock.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (method, route, status) -> count
+        self._requests = {}
+        # (method, route) -> [count per bucket..., +Inf count, sum]
+        self._latencies = {}
+        # status code -> count
+        self._errors = {}
+
+    def observe_request(self, method, route, status, duration):
+        bucket = bisect.bisect_left(self.buckets, duration)
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            latency = self._latencies.get((method, route))
+            if latency is None:
+                latency = [0] * (len(self.buckets) + 1) + [0.0]
+                self._latencies[(method, route)] = latency
+            latency[bucket] += 1
+            latency[-1] += duration
+
+    def count_error(self, status):
+        with self._lock:
+            self._errors[status] = self._errors.get(status, 0) + 1
+
+    def render(self, pools=None, caches=None):
+        """Return all metrics as Prometheus text, including the usage of
+           the {bind name: connection pool} pools and the hits and misses
+           of the {name: CachedValue} caches when given.
+        """
+
+        with self._lock:
+            requests = dict(self._requests)
+            latencies = {key: list(value)
+                         for key, value in self._latencies.items()}
+            errors = dict(self._errors)
+
+        lines = [
+            '# HELP trivia_requests_total Requests handled.',
+            '# TYPE trivia_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append('trivia_requests_total' + labels(
+                method=method, route=route, status=status) + f' {count}')
+
+        lines += [
+            '# HELP trivia_request_duration_seconds Request latency.',
+            '# TYPE trivia_request_duration_seconds histogram',
+        ]
+        for (method, route), latency in sorted(latencies.items()):
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, latency):
+                cumulative += count
+                lines.append('trivia_request_duration_seconds_bucket' + labels(
+                    method=method, route=route, le=bound) + f' {cumulative}')
+            route_labels = labels(method=method, route=route)
+            lines.append(f'trivia_request_duration_seconds_sum{route_labels}'
+                         f' {latency[-1]}')
+            lines.append(f'trivia_request_duration_seconds_count{route_labels}'
+                         f' {cumulative}')
+
+        lines += [
+            '# HELP trivia_errors_total Responses of the error handlers.',
+            '# TYPE trivia_errors_total counter',
+        ]
+        for status, count in sorted(errors.items()):
+            lines.append('trivia_errors_total' + labels(status=status) +
+                         f' {count}')
+
+        # Only QueuePool and its relatives track their connections
+        pools = {bind: pool for bind, pool in (pools or {}).items()
+                 if hasattr(pool, 'checkedout')}
+        if pools:
+            lines += [
+                '# HELP trivia_db_pool_connections Database pool connections.',
+                '# TYPE trivia_db_pool_connections gauge',
+            ]
+            for bind, pool in sorted(pools.items()):
+                for state, count in [('size', pool.size()),
+                                     ('checked_out', pool.checkedout()),
+                                     ('overflow', pool.overflow())]:
+                    lines.append('trivia_db_pool_connections' + labels(
+                        bind=bind, state=state) + f' {count}')
+
+        if caches:
+            lines += [
+                '# HELP trivia_cache_requests_total Cache lookups.',
+                '# TYPE trivia_cache_requests_total counter',
+            ]
+            for name, cache in sorted(caches.items()):
+                lines.append('trivia_cache_requests_total' + labels(
+                    cache=name, result='hit') + f' {cache.hits}')
+                lines.append('trivia_cache_requests_total' + labels(
+                    cache=name, result='miss') + f' {cache.misses}')
+
+        return '\n'.join(lines) + '\n'
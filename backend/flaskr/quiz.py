@@ -0,0 +1,268 @@
+import time
+import uuid
+import random
+import threading
+from collections import OrderedDict, deque
+
+# Random picks tried before falling back to filtering the whole bucket,
+# which only happens once most of a category has already been played
+MAX_RANDOM_TRIES = 8
+
+DIFFICULTIES = (1, 2, 3, 4, 5)
+
+
+class AliasTable:
+    """Walker's alias method: picks one of `items` with probability
+       proportional to its weight in O(1), after O(len(items)) setup.
+    """
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        count = len(self.items)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        self._probabilities = [1.0] * count
+        self._aliases = list(range(count))
+
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probabilities[less] = scaled[less]
+            self._aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def sample(self):
+        i = random.randrange(len(self.items))
+        if random.random() >= self._probabilities[i]:
+            i = self._aliases[i]
+        return self.items[i]
+
+
+def ramp_difficulty_weights(played, quiz_length):
+    """Difficulty weights for the next question of a quiz of quiz_length
+       questions after `played` of them, moving the most likely difficulty
+       from 1 on the first question to 5 on the last.
+    """
+
+    if quiz_length > 1:
+        progress = min(played, quiz_length - 1) / (quiz_length - 1)
+    else:
+        progress = 1.0
+    target = DIFFICULTIES[0] + progress * (DIFFICULTIES[-1] - DIFFICULTIES[0])
+    return {difficulty: 2.0 ** -abs(difficulty - target)
+            for difficulty in DIFFICULTIES}
+
+
+def quiz_difficulty_weights(played, difficulty_weights=None,
+                            ramp_length=None):
+    """Difficulty weights for the next question: the given weights
+       ({difficulty: weight}, None for any difficulty), multiplied by
+       the ramp of a quiz of ramp_length questions if there is one.
+    """
+
+    if ramp_length is None:
+        return difficulty_weights if difficulty_weights is not None else {0: 1}
+    ramp = ramp_difficulty_weights(played, ramp_length)
+    if difficulty_weights is None:
+        return ramp
+    return {difficulty: weight * difficulty_weights.get(difficulty, 0)
+            for difficulty, weight in ramp.items()}
+
+
+class QuestionIdIndex:
+    """Question ids bucketed by (category id, difficulty), used to draw
+       random quiz questions without reading the questions table.
+       0 stands for any category or difficulty, so bucket (0, 0) holds
+       the ids of all questions and (category id, 0) those of a category.
+    """
+
+    def __init__(self, rows=()):
+        # (category id, difficulty) -> (list of ids, {id: position in list})
+        self._buckets = {}
+        self._lock = threading.Lock()
+        for question_id, category_id, difficulty in rows:
+            self.add(question_id, category_id, difficulty)
+
+    def add(self, question_id, category_id, difficulty):
+        # A question without a category (its category was deleted) or
+        # difficulty is only in the buckets of any category or difficulty
+        category_id = int(category_id) if category_id is not None else 0
+        difficulty = int(difficulty) if difficulty is not None else 0
+        with self._lock:
+            for key in {(0, 0), (category_id, 0), (0, difficulty),
+                        (category_id, difficulty)}:
+                ids, positions = self._buckets.setdefault(key, ([], {}))
+                if question_id not in positions:
+                    positions[question_id] = len(ids)
+                    ids.append(question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            for ids, positions in self._buckets.values():
+                position = positions.pop(question_id, None)
+                if position is None:
+                    continue
+                # Swap the last id into the freed slot to keep removal O(1)
+                last_id = ids.pop()
+                if last_id != question_id:
+                    ids[position] = last_id
+                    positions[last_id] = position
+
+    def sample(self, category_id=0, k=1):
+        # Return up to k distinct random ids from the category's bucket
+        with self._lock:
+            bucket = self._buckets.get((category_id, 0))
+            if bucket is None:
+                return []
+            ids = bucket[0]
+            return random.sample(ids, min(k, len(ids)))
+
+    def draw(self, category_id=0, exclude=frozenset(), difficulty=0):
+        """Return a random id from the (category, difficulty) bucket that
+           is not in the `exclude` set, or None if every id is excluded.
+        """
+
+        with self._lock:
+            bucket = self._buckets.get((category_id, difficulty))
+            if bucket is None or not bucket[0]:
+                return None
+            ids = bucket[0]
+
+            for _ in range(MAX_RANDOM_TRIES):
+                question_id = random.choice(ids)
+                if question_id not in exclude:
+                    return question_id
+
+            candidates = [question_id for question_id in ids
+                          if question_id not in exclude]
+
+        if not candidates:
+            return None
+        return random.choice(candidates)
+
+    def draw_weighted(self, category_weights, difficulty_weights,
+                      exclude=frozenset()):
+        """Return a random id not in `exclude`, first picking a bucket with
+           probability proportional to the product of its category and
+           difficulty weights ({id: weight}, 0 meaning any), or None if
+           every id of the weighted buckets is excluded.
+        """
+
+        with self._lock:
+            keys = [(category_id, difficulty)
+                    for category_id, category_weight in category_weights.items()
+                    for difficulty, difficulty_weight
+                    in difficulty_weights.items()
+                    if category_weight > 0 and difficulty_weight > 0
+                    and self._buckets.get((category_id, difficulty),
+                                          ((), None))[0]]
+        weights = [category_weights[category_id] * difficulty_weights[difficulty]
+                   for category_id, difficulty in keys]
+
+        while keys:
+            category_id, difficulty = AliasTable(keys, weights).sample()
+            question_id = self.draw(category_id, exclude, difficulty)
+            if question_id is not None:
+                return question_id
+            # Every id of this bucket was played, draw from the others
+            i = keys.index((category_id, difficulty))
+            del keys[i], weights[i]
+        return None
+
+
+class QuizSessionStore:
+    """Pre-shuffled question ids of running quizzes, keyed by session id.
+       Holds at most `max_sessions` sessions and drops those not used for
+       `ttl` seconds, evicting the least recently used first.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session id -> (deque of question ids, expiry time)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, question_ids):
+        session_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session_id] = (deque(question_ids), now + self.ttl)
+        return session_id
+
+    def next_id(self, session_id):
+        """Pop the next question id of the session, or return None once
+           the session has run out of questions.
+           Raises KeyError for an unknown or expired session.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            question_ids, _ = self._sessions.pop(session_id)
+            self._sessions[session_id] = (question_ids, now + self.ttl)
+            if not question_ids:
+                return None
+            return question_ids.popleft()
+
+    def _expire(self, now):
+        # Sessions are kept in order of last use, so expired ones come first
+        while self._sessions:
+            session_id, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now:
+                break
+            del self._sessions[session_id]
+
+
+class RedisQuizSessionStore:
+    """Quiz sessions shared by all processes, kept in Redis (or a compatible
+       server) so any of them can serve the next question. A session is a
+       list of question ids and a marker key, both dropped after `ttl`
+       seconds without use. Needs the optional redis package.
+    """
+
+    def __init__(self, url, ttl=3600, prefix='trivia:quiz:'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        # The marker outlives the list, which Redis deletes once emptied
+        key = self.prefix + session_id
+        return key, key + ':ids'
+
+    def create(self, question_ids):
+        session_id = uuid.uuid4().hex
+        marker, ids = self._keys(session_id)
+        pipeline = self._redis.pipeline()
+        pipeline.set(marker, 1, ex=self.ttl)
+        if question_ids:
+            pipeline.rpush(ids, *question_ids)
+            pipeline.expire(ids, self.ttl)
+        pipeline.execute()
+        return session_id
+
+    def next_id(self, session_id):
+        """Pop the next question id of the session, or return None once
+           the session has run out of questions.
+           Raises KeyError for an unknown or expired session.
+        """
+
+        marker, ids = self._keys(session_id)
+        pipeline = self._redis.pipeline()
+        pipeline.expire(marker, self.ttl)
+        pipeline.lpop(ids)
+        pipeline.expire(ids, self.ttl)
+        live, question_id, _ = pipeline.execute()
+        if not live:
+            raise KeyError(session_id)
+        if question_id is None:
+            return None
+        return int(question_id)
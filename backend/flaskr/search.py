@@ -0,0 +1,136 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.sql import func, literal_column, column
+
+from models import db, Question
+from .serialization import question_rows
+
+# Must match the expressions of the indexes made by create_search_index()
+TS_CONFIG = literal_column("'english'")
+EMPTY_TEXT = literal_column("''")
+SPACE = literal_column("' '")
+
+SQLITE_SEARCH = """
+    SELECT questions.id, questions.question, questions.answer,
+           questions.category, questions.difficulty
+    FROM questions
+    JOIN questions_fts ON questions_fts.rowid = questions.id
+    WHERE questions_fts MATCH :match
+    ORDER BY questions_fts.rank, questions.id
+    LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_SEARCH_COUNT = """
+    SELECT count(*) FROM questions_fts WHERE questions_fts MATCH :match
+"""
+
+SQLITE_SEARCH_IDS = """
+    SELECT rowid FROM questions_fts WHERE questions_fts MATCH :match
+"""
+
+
+def search_questions(search_term, include_answers, page, per_page):
+    """Return one page of the questions matching the search term as
+       QUESTION_COLUMNS rows, best matches first, and the total number of
+       matches.
+       Answers are searched too if include_answers is set.
+    """
+
+    terms = re.findall(r'\w+', search_term)
+    dialect = db.engine.dialect.name
+    start = (page - 1) * per_page
+
+    if terms and dialect == 'postgresql':
+        return postgres_search(terms, include_answers, start, per_page)
+    if terms and dialect == 'sqlite':
+        return sqlite_search(terms, include_answers, start, per_page)
+    return substring_search(search_term, include_answers, start, per_page)
+
+
+def search_condition(search_term, include_answers=False):
+    """Return a filter on Question matching the same questions as
+       search_questions, for set-based updates and deletes.
+    """
+
+    terms = re.findall(r'\w+', search_term)
+    dialect = db.engine.dialect.name
+
+    if terms and dialect == 'postgresql':
+        vector, query = postgres_match(terms, include_answers)
+        return vector.op('@@')(query)
+    if terms and dialect == 'sqlite':
+        ids = text(SQLITE_SEARCH_IDS).bindparams(
+            match=sqlite_match(terms, include_answers)).columns(column('rowid'))
+        return Question.id.in_(ids)
+    return substring_condition(search_term, include_answers)
+
+
+def prefix_tsquery(terms):
+    # Every word has to match as a prefix, as in sqlite_match
+    return ' & '.join('{}:*'.format(term) for term in terms)
+
+
+def postgres_match(terms, include_answers):
+    # The indexed document and the query to match it against
+    document = func.coalesce(Question.question, EMPTY_TEXT)
+    if include_answers:
+        document = document.op('||')(SPACE).op('||')(
+            func.coalesce(Question.answer, EMPTY_TEXT))
+    vector = func.to_tsvector(TS_CONFIG, document)
+    query = func.to_tsquery(TS_CONFIG, prefix_tsquery(terms))
+    return vector, query
+
+
+def postgres_search(terms, include_answers, start, limit):
+    vector, query = postgres_match(terms, include_answers)
+
+    selection = Question.query.filter(vector.op('@@')(query))
+    total_questions_count = selection.count()
+    questions = question_rows(selection).order_by(
+        func.ts_rank(vector, query).desc(), Question.id).\
+        offset(start).limit(limit).all()
+    return questions, total_questions_count
+
+
+def sqlite_match(terms, include_answers):
+    # Every word has to match as a prefix, like a substring search would
+    match = ' '.join('"{}"*'.format(term) for term in terms)
+    if not include_answers:
+        match = 'question : ({})'.format(match)
+    return match
+
+
+def sqlite_search(terms, include_answers, start, limit):
+    match = sqlite_match(terms, include_answers)
+
+    total_questions_count = db.session.execute(
+        text(SQLITE_SEARCH_COUNT), {'match': match}).scalar()
+    questions = db.session.execute(text(SQLITE_SEARCH), {
+        'match': match, 'limit': limit, 'offset': start}).fetchall()
+    return questions, total_questions_count
+
+
+def like_pattern(search_term):
+    # Match search_term anywhere, its LIKE wildcards taken literally
+    escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').\
+        replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def substring_condition(search_term, include_answers):
+    pattern = like_pattern(search_term)
+    condition = Question.question.ilike(pattern, escape='\\')
+    if include_answers:
+        condition = condition | Question.answer.ilike(pattern, escape='\\')
+    return condition
+
+
+def substring_search(search_term, include_answers, start, limit):
+    # Unindexed fallback for other databases and searches without words
+    selection = Question.query.filter(
+        substring_condition(search_term, include_answers))
+    total_questions_count = selection.count()
+    questions = question_rows(selection).order_by(Question.id).\
+        offset(start).limit(limit).all()
+    return questions, total_questions_count
@@ -0,0 +1,41 @@
+import json
+
+from flask import current_app
+
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The keys of Question.format(), in column order
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = tuple(getattr(Question, field) for field in QUESTION_FIELDS)
+
+
+def question_rows(selection):
+    # Select only the formatted columns of a questions query, as tuples
+    return selection.with_entities(*QUESTION_COLUMNS)
+
+
+def format_question_row(row):
+    # Same dict as Question.format(), built from a QUESTION_COLUMNS row
+    return dict(zip(QUESTION_FIELDS, row))
+
+
+def dumps(payload):
+    """Encode payload as compact JSON bytes, with orjson if it is
+       installed. Non-string keys (category ids) become strings, as with
+       jsonify.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    # Faster jsonify for large listings
+    return current_app.response_class(dumps(payload), status=status,
+                                      mimetype='application/json')
@@ -0,0 +1,127 @@
+import re
+import json
+import heapq
+import bisect
+import threading
+import unicodedata
+from collections import Counter
+
+# Words of fewer characters aren't suggested
+MIN_TERM_LENGTH = 2
+# Prefixes of more words than this keep their most common words ranked,
+# rather than ranking all of them on every lookup
+MAX_SCANNED_TERMS = 256
+# Words kept ranked per such prefix, enough for the largest limit
+RANKED_TERMS = 32
+
+
+def normalize(text):
+    # Lower case without accents, so "Éclair" is found by "ecl"
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed
+                   if not unicodedata.combining(char))
+
+
+def terms_of(text):
+    # The distinct normalized words of a question text
+    if not text:
+        return set()
+    return {term for term in re.findall(r'\w+', normalize(text))
+            if len(term) >= MIN_TERM_LENGTH}
+
+
+class PrefixIndex:
+    """The normalized words of the question texts, each with the number of
+       questions using it, in a sorted list searched by bisection.
+       Holds at most `max_terms` words: the most common ones when built,
+       new words are left out once it is full.
+       Prefixes of many words, like one letter, cache their most common
+       words until one of them is added or removed.
+    """
+
+    def __init__(self, counts=(), max_terms=100000):
+        self.max_terms = max_terms
+        counts = Counter(dict(counts))
+        self._counts = dict(counts.most_common(max_terms))
+        self._terms = sorted(self._counts)
+        # prefix -> its RANKED_TERMS most common (word, count) pairs
+        self._ranked = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_texts(cls, texts, max_terms=100000):
+        counts = Counter()
+        for text in texts:
+            counts.update(terms_of(text))
+        return cls(counts, max_terms)
+
+    @classmethod
+    def load(cls, path, max_terms=100000):
+        # Read a snapshot written by save()
+        with open(path, encoding='utf-8') as snapshot:
+            return cls(json.load(snapshot), max_terms)
+
+    def save(self, path):
+        with self._lock:
+            counts = dict(self._counts)
+        with open(path, 'w', encoding='utf-8') as snapshot:
+            json.dump(counts, snapshot, ensure_ascii=False,
+                      separators=(',', ':'))
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add_text(self, text):
+        with self._lock:
+            for term in terms_of(text):
+                if term in self._counts:
+                    self._counts[term] += 1
+                elif len(self._terms) < self.max_terms:
+                    self._counts[term] = 1
+                    bisect.insort(self._terms, term)
+                else:
+                    continue
+                self._forget_rankings(term)
+
+    def remove_text(self, text):
+        with self._lock:
+            for term in terms_of(text):
+                count = self._counts.get(term)
+                if count is None:
+                    continue
+                self._forget_rankings(term)
+                if count > 1:
+                    self._counts[term] = count - 1
+                    continue
+                del self._counts[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _forget_rankings(self, term):
+        # The count of term changed, so did the rankings of its prefixes
+        for end in range(len(term) + 1):
+            self._ranked.pop(term[:end], None)
+
+    def complete(self, prefix, limit=10):
+        """Return up to `limit` (word, question count) pairs of the words
+           starting with prefix, most common first.
+        """
+
+        prefix = normalize(prefix)
+        with self._lock:
+            ranked = self._ranked.get(prefix)
+            if ranked is None or limit > RANKED_TERMS:
+                start = bisect.bisect_left(self._terms, prefix)
+                end = bisect.bisect_left(self._terms, prefix + '\U0010ffff',
+                                         start)
+                candidates = ((term, self._counts[term])
+                              for term in self._terms[start:end])
+                ranked = most_common(candidates, max(limit, RANKED_TERMS))
+                if end - start > MAX_SCANNED_TERMS:
+                    self._ranked[prefix] = ranked[:RANKED_TERMS]
+        return ranked[:limit]
+
+
+def most_common(candidates, limit):
+    # Ties go to the word first in alphabetical order
+    return heapq.nsmallest(limit, candidates,
+                           key=lambda candidate: (-candidate[1], candidate[0]))
@@ -0,0 +1,88 @@
+"""Integer category, its foreign key and indexes on questions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from models import create_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def category_is_integer():
+    if op.get_context().as_sql:
+        # No database to look at when only generating SQL
+        return False
+    inspector = sa.inspect(op.get_bind())
+    for column in inspector.get_columns('questions'):
+        if column['name'] == 'category':
+            return isinstance(column['type'], sa.Integer)
+    return False
+
+
+def has_category_foreign_key():
+    if op.get_context().as_sql:
+        # Assume the foreign key of trivia.psql (and 0001) is there
+        return True
+    inspector = sa.inspect(op.get_bind())
+    return any(foreign_key['constrained_columns'] == ['category']
+               for foreign_key in inspector.get_foreign_keys('questions'))
+
+
+def upgrade():
+    # trivia.psql and 0001 already have the foreign key; only add it to
+    # databases made without one
+    add_foreign_key = not has_category_foreign_key()
+
+    if op.get_context().dialect.name != 'postgresql':
+        # SQLite can't alter columns or add constraints in place,
+        # batch mode copies the table instead
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.alter_column('category', type_=sa.Integer())
+            if add_foreign_key:
+                batch_op.create_foreign_key(
+                    'category', 'categories', ['category'], ['id'],
+                    onupdate='CASCADE', ondelete='SET NULL')
+            batch_op.create_index('ix_questions_category', ['category'])
+            batch_op.create_index('ix_questions_difficulty', ['difficulty'])
+        # Copying the table dropped the triggers keeping the full-text
+        # search table in sync
+        if not op.get_context().as_sql:
+            create_search_index(op.get_bind())
+        return
+
+    # Databases restored from trivia.psql already have an integer column.
+    # Changing the type rewrites the table under an exclusive lock.
+    if not category_is_integer():
+        op.alter_column('questions', 'category', type_=sa.Integer(),
+                        postgresql_using='category::integer')
+
+    # Build the indexes and check the foreign key without blocking writes:
+    # each statement runs in its own transaction
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                   'ix_questions_category ON questions (category)')
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                   'ix_questions_difficulty ON questions (difficulty)')
+        if add_foreign_key:
+            op.execute('ALTER TABLE questions ADD CONSTRAINT category '
+                       'FOREIGN KEY (category) REFERENCES categories (id) '
+                       'ON UPDATE CASCADE ON DELETE SET NULL NOT VALID')
+            op.execute('ALTER TABLE questions VALIDATE CONSTRAINT category')
+
+
+def downgrade():
+    # The category column stays an integer and keeps its foreign key,
+    # as in trivia.psql
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_index('ix_questions_difficulty')
+        batch_op.drop_index('ix_questions_category')
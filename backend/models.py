@@ -1,30 +1,194 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+from flask import g, has_app_context
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine, text
+from sqlalchemy import orm
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
 # delete db at the end of triviadb when working at home
 database_name = 'trivia'
-myuser = os.environ['DB_USERNAME']
-mypassword = os.environ['DB_PASSWORD']
-database_path = "postgresql://{}:{}@{}/{}".format(myuser, mypassword,
-                                                  'localhost:5432',
-                                                  database_name)
 
-db = SQLAlchemy()
+'''
+database_path_from_env()
+    the PostgreSQL URL of the trivia database, with the credentials from
+    DB_USERNAME and DB_PASSWORD. Read by create_app rather than on import,
+    so the app can be configured without them.
+'''
+def database_path_from_env(environ=os.environ):
+    myuser = environ['DB_USERNAME']
+    mypassword = environ['DB_PASSWORD']
+    return "postgresql://{}:{}@{}/{}".format(myuser, mypassword,
+                                             'localhost:5432',
+                                             database_name)
+
+'''
+engine_options_from_env()
+    SQLAlchemy engine and pool options set by DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT (seconds), DB_POOL_RECYCLE (seconds), DB_POOL_PRE_PING
+    and DB_STATEMENT_TIMEOUT (milliseconds, PostgreSQL only)
+'''
+def engine_options_from_env(environ=os.environ):
+    options = {}
+    for variable, option in [('DB_POOL_SIZE', 'pool_size'),
+                             ('DB_MAX_OVERFLOW', 'max_overflow'),
+                             ('DB_POOL_TIMEOUT', 'pool_timeout'),
+                             ('DB_POOL_RECYCLE', 'pool_recycle')]:
+        if environ.get(variable):
+            options[option] = int(environ[variable])
+    if environ.get('DB_POOL_PRE_PING'):
+        options['pool_pre_ping'] = environ['DB_POOL_PRE_PING'].lower() in \
+            ('1', 'true', 'yes')
+    if environ.get('DB_STATEMENT_TIMEOUT'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(
+                int(environ['DB_STATEMENT_TIMEOUT']))}
+    return options
+
+'''
+use_read_replica()
+    sends the remaining queries of the current request to the 'replica'
+    bind, if DATABASE_REPLICA_URL is configured. Call it first thing in
+    handlers that only read.
+'''
+def use_read_replica():
+    g.db_read_only = True
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        binds = self.app.config['SQLALCHEMY_BINDS'] or {}
+        if 'replica' in binds and not self._flushing and \
+           has_app_context() and g.get('db_read_only'):
+            return db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, without connecting
+    to the database. SQLALCHEMY_ENGINE_OPTIONS and DATABASE_REPLICA_URL are
+    taken from the app config, or else from the environment.
+    Tables and indexes are made by init_db().
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=None):
+    if database_path is None:
+        database_path = database_path_from_env()
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if app.config.get("SQLALCHEMY_ENGINE_OPTIONS") is None:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options_from_env()
+
+    replica_path = app.config.get("DATABASE_REPLICA_URL",
+                                  os.environ.get("DATABASE_REPLICA_URL"))
+    if replica_path:
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds["replica"] = replica_path
+        app.config["SQLALCHEMY_BINDS"] = binds
+
     db.app = app
     db.init_app(app)
-    db.create_all()
     return db
 
+'''
+bind_engines()
+    the engine of every bind of the current app by name, 'default' for the
+    main database, so the read replica is instrumented as well
+'''
+def bind_engines():
+    engines = {'default': db.engine}
+    for bind in db.get_app().config.get("SQLALCHEMY_BINDS") or {}:
+        engines[bind] = db.get_engine(bind=bind)
+    return engines
+
+'''
+init_db()
+    creates the tables that don't exist yet and the full-text search index.
+    Run once per database with `flask init-db` rather than on every start.
+'''
+def init_db():
+    db.create_all()
+    create_search_index()
+
+'''
+create_search_index()
+    creates the full-text search index over question and answer texts if it
+    doesn't exist yet: GIN indexes on tsvectors in PostgreSQL, an FTS5 table
+    kept in sync by triggers in SQLite. SQLite drops the triggers when a
+    migration rebuilds the questions table, so missing ones are put back
+    and the FTS5 table is rebuilt; such migrations call it on their own
+    connection.
+'''
+POSTGRES_SEARCH_INDEX = [
+    """CREATE INDEX IF NOT EXISTS ix_questions_question_fts ON questions
+       USING gin (to_tsvector('english', coalesce(question, '')))""",
+    """CREATE INDEX IF NOT EXISTS ix_questions_question_answer_fts ON questions
+       USING gin (to_tsvector('english', coalesce(question, '') || ' ' ||
+                                         coalesce(answer, '')))""",
+]
+
+SQLITE_SEARCH_TABLE = """CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts
+    USING fts5(question, answer, content='questions', content_rowid='id')"""
+
+SQLITE_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+       INSERT INTO questions_fts(rowid, question, answer)
+       VALUES (new.id, new.question, new.answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+       INSERT INTO questions_fts(questions_fts, rowid, question, answer)
+       VALUES ('delete', old.id, old.question, old.answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions BEGIN
+       INSERT INTO questions_fts(questions_fts, rowid, question, answer)
+       VALUES ('delete', old.id, old.question, old.answer);
+       INSERT INTO questions_fts(rowid, question, answer)
+       VALUES (new.id, new.question, new.answer);
+       END""",
+]
+
+SQLITE_SEARCH_REBUILD = "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')"
+
+def create_search_index(connection=None):
+    if connection is None:
+        with db.engine.begin() as connection:
+            return create_search_index(connection)
+
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_SEARCH_INDEX:
+            connection.execute(text(statement))
+    elif dialect == 'sqlite':
+        existing = connection.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE name IN "
+            "('questions_fts', 'questions_fts_insert', "
+            "'questions_fts_delete', 'questions_fts_update')")).scalar()
+        if existing == 4:
+            return
+        connection.execute(text(SQLITE_SEARCH_TABLE))
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            connection.execute(text(statement))
+        connection.execute(text(SQLITE_SEARCH_REBUILD))
+
+'''
+on_write(listener)
+    registers listener(model, action, instance) to be called after an
+    insert, update or delete of a model has been committed, e.g. to drop
+    in-process caches. instance is None for writes to many rows at once
+'''
+write_listeners = []
+
+def on_write(listener):
+    write_listeners.append(listener)
+    return listener
+
+def notify_write(model, action, instance=None):
+    for listener in write_listeners:
+        listener(model, action, instance)
+
 '''
 Question
 
@@ -35,8 +199,13 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
-    difficulty = Column(Integer)
+    # Same foreign key as in trivia.psql: deleting a category leaves its
+    # questions without one
+    category = Column(Integer, ForeignKey('categories.id', name='category',
+                                          ondelete='SET NULL',
+                                          onupdate='CASCADE'),
+                      index=True)
+    difficulty = Column(Integer, index=True)
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
@@ -47,13 +216,16 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_write(Question, 'insert', self)
 
     def update(self):
         db.session.commit()
+        notify_write(Question, 'update', self)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        notify_write(Question, 'delete', self)
 
     def format(self):
         return {
@@ -77,6 +249,22 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+        notify_write(Category, 'insert', self)
+
+    def update(self):
+        db.session.commit()
+        notify_write(Category, 'update', self)
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+        notify_write(Category, 'delete', self)
+        # The database cleared the category of its questions
+        notify_write(Question, 'update')
+
     def format(self):
         return {
           'id': self.id,
@@ -1,40 +1,109 @@
 import os
+import csv
+import re
 import unittest
 import json
+import tempfile
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.search import postgres_match
+from flaskr.suggest import PrefixIndex
+from models import db, init_db, notify_write, engine_options_from_env, \
+                   Question, Category
+
+# The tests use an in-memory SQLite database seeded from trivia.psql,
+# one per process, so they can also run in parallel (pytest -n auto).
+# Set TEST_DATABASE_URL to run them against a PostgreSQL database restored
+# from trivia.psql instead.
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'trivia.psql')
+COPY_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r'}
+
+
+def read_psql_fixture(path=FIXTURE_PATH):
+    # Return {table name: [row dicts]} from the COPY blocks of a pg_dump
+    tables = {}
+    rows = None
+    with open(path, encoding='utf-8') as dump:
+        for line in dump:
+            line = line.rstrip('\n')
+            if rows is None:
+                match = re.match(r'COPY public\.(\w+) \((.*)\) FROM stdin;$',
+                                 line)
+                if match:
+                    columns = match.group(2).split(', ')
+                    rows = tables.setdefault(match.group(1), [])
+            elif line == '\\.':
+                rows = None
+            else:
+                rows.append(dict(zip(columns, map(copy_value,
+                                                  line.split('\t')))))
+    return tables
+
+
+def copy_value(text):
+    # Undo the escaping of a COPY text format field
+    if text == '\\N':
+        return None
+    return re.sub(r'\\(.)', lambda match: COPY_ESCAPES.get(match.group(1),
+                                                          match.group(1)),
+                  text)
+
+
+def seed_from_fixture(tables):
+    for model in (Category, Question):
+        table = model.__table__
+        rows = [{name: int(value) if value is not None and
+                 table.c[name].type.python_type is int else value
+                 for name, value in row.items()}
+                for row in tables[table.name]]
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the app and its database once per process."""
+        cls.app = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+                              'TESTING': True,
+                              'QUERY_STATS': True})
+        cls.app_session = db.session
+        with cls.app.app_context():
+            init_db()
+            if db.engine.dialect.name == 'sqlite' and \
+               Category.query.count() == 0:
+                seed_from_fixture(read_psql_fixture())
+            db.session.remove()
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Run the test in a transaction that tearDown rolls back."""
         self.client = self.app.test_client
-
-        self.database_name = "trivia_test"
-        myuser = os.environ['DB_USERNAME']
-        mypassword = os.environ['DB_PASSWORD']
-        self.database_path = "postgresql://{}:{}@{}/{}".format(myuser,
-                                                                mypassword,
-                                                                'localhost:5432',
-                                                                self.database_name)
-
-        self.db = setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        #with self.app.app_context():
-        #    self.db = SQLAlchemy()
-        #    self.db.init_app(self.app)
-            # create all tables
-        #    self.db.create_all()
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        # Sessions join the transaction, so their commits don't end it
+        db.session = db.create_scoped_session(
+            {'bind': self.connection, 'binds': {}})
+        # Drop what the in-process caches kept from earlier tests
+        notify_write(Category, 'update')
+        notify_write(Question, 'update')
 
     def tearDown(self):
         """Executed after each test"""
-        pass
+        db.session.remove()
+        db.session = self.app_session
+        rolled_back = not self.transaction.is_active
+        self.transaction.rollback()
+        self.connection.close()
+        self.assertFalse(rolled_back,
+                         'the app rolled back the test transaction')
 
     """
     DONE
@@ -58,6 +127,160 @@ class TriviaTestCase(unittest.TestCase):
             self.assertTrue(len(data['question']))
             self.assertFalse(data['question']['id'] in previous_questions)
 
+    def test_play_a_category_until_out_of_questions(self):
+        previous_questions = []
+        quiz_category = {'type': 'Science', 'id': 1}
+        while True:
+            dc = {'previous_questions': previous_questions,
+                  'quiz_category': quiz_category}
+
+            res = self.client().post('/quizzes', json = dc)
+            data = json.loads(res.data)
+            if res.status_code != 200:
+                break
+
+            self.assertEqual(int(data['question']['category']), 1)
+            self.assertFalse(data['question']['id'] in previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+        self.assertTrue(len(previous_questions))
+
+    def test_play_a_weighted_quiz(self):
+        # Only difficulty 1 and 2 questions of categories 1 and 4
+        previous_questions = []
+        for _ in range(5):
+            dc = {'previous_questions': previous_questions,
+                  'quiz_category': {'id': 0},
+                  'category_weights': {'1': 3, '4': 1},
+                  'difficulty_weights': {'1': 1, '2': 2},
+                  'difficulty_ramp': 5}
+
+            res = self.client().post('/quizzes', json = dc)
+            data = json.loads(res.data)
+            if res.status_code != 200:
+                break
+
+            self.assertIn(int(data['question']['category']), (1, 4))
+            self.assertIn(data['question']['difficulty'], (1, 2))
+            self.assertFalse(data['question']['id'] in previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertTrue(len(previous_questions))
+
+    def test_draw_several_quiz_questions_at_once(self):
+        dc = {'previous_questions': [1, 2, 3],
+              'quiz_category': {'id': 0},
+              'count': 5}
+
+        res = self.client().post('/quizzes', json = dc)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        ids = [question['id'] for question in data['questions']]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertFalse(set(ids) & set(dc['previous_questions']))
+        self.assertEqual(data['question'], data['questions'][0])
+
+    def test_quiz_includes_uncategorized_questions(self):
+        with self.app.app_context():
+            question = Question('uncategorized question', 'answer', None, None)
+            question.insert()
+            question_id = question.id
+
+        res = self.client().post('/quizzes', json = {
+            'previous_questions': [], 'quiz_category': {'id': 0},
+            'count': 50})
+        data = json.loads(res.data)
+        res_session = self.client().post('/quizzes/sessions',
+                                         json = {'quiz_category': {'id': 0}})
+        res_category = self.client().post('/quizzes', json = {
+            'previous_questions': [], 'quiz_category': {'id': 1},
+            'count': 50})
+        data_category = json.loads(res_category.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(question_id,
+                      [question['id'] for question in data['questions']])
+        self.assertEqual(res_session.status_code, 200)
+        self.assertEqual(res_category.status_code, 200)
+        self.assertNotIn(question_id, [question['id'] for question
+                                       in data_category['questions']])
+
+    def test_400_sent_for_negative_quiz_weights(self):
+        res = self.client().post('/quizzes', json = {
+            'previous_questions': [], 'quiz_category': {'id': 0},
+            'difficulty_weights': {'1': -1}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_play_a_quiz_session(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json = {'quiz_category': {'id': 0}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['total_questions'])
+        session_id = data['session_id']
+
+        played_ids = []
+        for _ in range(data['total_questions']):
+            res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertFalse(data['question']['id'] in played_ids)
+            played_ids.append(data['question']['id'])
+
+        res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(data['question'])
+
+    def test_404_sent_for_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_unknown_quiz_session_store_is_rejected(self):
+        with self.assertRaises(ValueError):
+            create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+                        'QUIZ_SESSIONS': 'memcached'})
+
+    def test_get_question_follows_updates(self):
+        res_list = self.client().get('/questions')
+        listed = json.loads(res_list.data)['questions'][0]
+
+        res = self.client().get(f"/questions/{listed['id']}")
+        data = json.loads(res.data)
+        new_difficulty = listed['difficulty'] % 5 + 1
+        self.client().patch('/questions', json = {
+            'ids': [listed['id']], 'set': {'difficulty': new_difficulty}})
+        res_updated = self.client().get(f"/questions/{listed['id']}")
+        data_updated = json.loads(res_updated.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], listed)
+        self.assertEqual(data_updated['question']['difficulty'],
+                         new_difficulty)
+
+    def test_404_sent_requesting_non_existant_question(self):
+        res = self.client().get('/questions/100000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+
     def test_delete_non_existant_question(self):
         res = self.client().delete(f'/questions/1000')
         data = json.loads(res.data)
@@ -176,6 +399,256 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(data_add['created'], data_del['deleted'])
 
+    def test_add_delete_a_question_with_minimal_response(self):
+        new_question = {'question': 'new question',
+                        'answer': 'new answer',
+                        'difficulty': 3,
+                        'category': 5}
+
+        res_add = self.client().post('/questions?return=minimal',
+                                     json = new_question)
+        data_add = json.loads(res_add.data)
+
+        self.assertEqual(res_add.status_code, 200)
+        self.assertTrue(data_add['success'])
+        self.assertIsInstance(data_add['created'], int)
+        self.assertTrue(data_add['total_questions'])
+        self.assertFalse('questions' in data_add)
+
+        res_del = self.client().delete(f"/questions/{data_add['created']}",
+                                       headers={'Prefer': 'return=minimal'})
+        data_del = json.loads(res_del.data)
+
+        self.assertEqual(res_del.status_code, 200)
+        self.assertEqual(data_del['deleted'], data_add['created'])
+        self.assertEqual(data_del['total_questions'],
+                         data_add['total_questions'] - 1)
+        self.assertFalse('questions' in data_del)
+
+    def test_search_answers(self):
+        test_word = 'QvNrwTzkLp'
+        new_question = {'question': 'new question',
+                        'answer': f'new answer {test_word}',
+                        'difficulty': 3,
+                        'category': 5}
+        res_add = self.client().post('/questions', json = new_question)
+        question_id = json.loads(res_add.data)['created']
+
+        res_question = self.client().post('/questions',
+                                          json = {'searchTerm': test_word})
+        data_question = json.loads(res_question.data)
+        res_answer = self.client().post('/questions',
+                                        json = {'searchTerm': test_word,
+                                                'searchAnswers': True})
+        data_answer = json.loads(res_answer.data)
+        self.client().delete(f'/questions/{question_id}')
+
+        self.assertEqual(res_question.status_code, 200)
+        self.assertEqual(data_question['total_questions'], 0)
+        self.assertEqual(res_answer.status_code, 200)
+        self.assertEqual(data_answer['total_questions'], 1)
+        self.assertEqual(data_answer['questions'][0]['id'], question_id)
+
+    def test_suggestions_follow_added_and_deleted_questions(self):
+        res = self.client().get('/questions/suggest?q=Which%20qvzx')
+        data_before = json.loads(res.data)
+
+        new_question = {'question': 'Which qvzxmuseum is the oldest?',
+                        'answer': 'Ashmolean', 'category': 2, 'difficulty': 3}
+        res = self.client().post('/questions?return=minimal',
+                                 json = new_question)
+        question_id = json.loads(res.data)['created']
+        res = self.client().get('/questions/suggest?q=Which%20qvzx')
+        data_added = json.loads(res.data)
+
+        self.client().delete(f'/questions/{question_id}?return=minimal')
+        res = self.client().get('/questions/suggest?q=Which%20qvzx')
+        data_deleted = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_before['suggestions'], [])
+        self.assertEqual(data_added['suggestions'], ['Which qvzxmuseum'])
+        self.assertEqual(data_deleted['suggestions'], [])
+
+    def test_suggestions_rank_every_word_of_a_short_prefix(self):
+        texts = [f'w{n:04d}' for n in range(1000)] + ['why'] * 50
+        index = PrefixIndex.from_texts(texts)
+
+        suggested = index.complete('w', 3)
+        for _ in range(60):
+            index.add_text('w0999')
+        suggested_added = index.complete('w', 2)
+
+        self.assertEqual(suggested, [('why', 50), ('w0000', 1), ('w0001', 1)])
+        self.assertEqual(suggested_added, [('w0999', 61), ('why', 50)])
+
+    def test_postgres_search_matches_word_prefixes(self):
+        vector, query = postgres_match(['tit', 'Hank'], True)
+        compiled = vector.op('@@')(query).compile(
+            dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+
+        self.assertIn("to_tsquery('english', 'tit:* & Hank:*')", str(compiled))
+        self.assertIn("coalesce(questions.answer, '')", str(compiled))
+
+    def test_bulk_import_reports_undecodable_rows(self):
+        valid = json.dumps({'question': 'imported question', 'answer': 'answer',
+                            'difficulty': 2, 'category': 1}).encode('utf-8')
+        body = b'\n'.join([valid, b'{"question": "caf\xe9"}', valid])
+
+        res = self.client().post('/questions/bulk', data = body,
+                                 content_type = 'application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual(data['errors'],
+                         [{'row': 2, 'error': 'invalid record: not valid UTF-8'}])
+
+    def test_bulk_import_reports_unreadable_csv_rows(self):
+        body = ('question,answer,difficulty,category\n'
+                f'"{"x" * (csv.field_size_limit() + 1)}",answer,2,1\n'
+                'imported question,answer,2,1\n'
+                'caf\udce9,answer,2,1\n').encode('utf-8', 'surrogateescape')
+
+        res = self.client().post('/questions/bulk', data = body,
+                                 content_type = 'text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual([error['row'] for error in data['errors']], [1, 3])
+
+    def test_bulk_import_questions(self):
+        test_word = 'XkWmqPzRtd'
+        rows = [{'question': f'imported question {test_word}',
+                 'answer': 'imported answer',
+                 'difficulty': 2,
+                 'category': 1},
+                {'question': 'imported question without answer',
+                 'difficulty': 2,
+                 'category': 1}]
+        body = '\n'.join(json.dumps(row) for row in rows)
+
+        res = self.client().post('/questions/bulk', data = body,
+                                 content_type = 'application/x-ndjson')
+        data = json.loads(res.data)
+
+        res_search = self.client().post('/questions',
+                                        json = {'searchTerm': test_word})
+        data_search = json.loads(res_search.data)
+        for question in data_search['questions']:
+            self.client().delete(f"/questions/{question['id']}")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(data['error_count'], 1)
+        self.assertEqual(data['errors'][0]['row'], 2)
+        self.assertEqual(data_search['total_questions'], 1)
+
+    def test_bulk_update_and_delete_questions(self):
+        test_word = 'QbvRkeLnwz'
+        rows = [{'question': f'moderated question {test_word} {n}',
+                 'answer': 'moderated answer',
+                 'difficulty': 1,
+                 'category': 1} for n in range(3)]
+        body = '\n'.join(json.dumps(row) for row in rows)
+        self.client().post('/questions/bulk', data = body,
+                           content_type = 'application/x-ndjson')
+
+        res_update = self.client().patch('/questions', json = {
+            'searchTerm': test_word, 'set': {'difficulty': 5, 'category': 2}})
+        data_update = json.loads(res_update.data)
+
+        res_search = self.client().post('/questions',
+                                        json = {'searchTerm': test_word})
+        data_search = json.loads(res_search.data)
+        ids = [question['id'] for question in data_search['questions']]
+
+        res_delete = self.client().delete('/questions', json = {
+            'ids': ids, 'category': 2, 'difficulty': 5})
+        data_delete = json.loads(res_delete.data)
+
+        self.assertEqual(res_update.status_code, 200)
+        self.assertEqual(data_update['updated'], 3)
+        self.assertTrue(res_update.headers['Server-Timing'].endswith(
+            'queries, 3 rows affected"'))
+        self.assertTrue(all(question['difficulty'] == 5 and
+                            int(question['category']) == 2
+                            for question in data_search['questions']))
+        self.assertEqual(res_delete.status_code, 200)
+        self.assertEqual(data_delete['deleted'], 3)
+
+    def test_bulk_update_searching_answers(self):
+        test_word = 'ZkqPwnRoaj'
+        self.client().post('/questions', json = {
+            'question': 'bulk question', 'answer': f'answer {test_word}',
+            'difficulty': 1, 'category': 1})
+
+        res_questions = self.client().patch('/questions', json = {
+            'searchTerm': test_word, 'set': {'difficulty': 4}})
+        res_answers = self.client().patch('/questions', json = {
+            'searchTerm': test_word, 'searchAnswers': True,
+            'set': {'difficulty': 4}})
+
+        self.assertEqual(json.loads(res_questions.data)['updated'], 0)
+        self.assertEqual(json.loads(res_answers.data)['updated'], 1)
+
+    def test_400_sent_for_bulk_delete_without_filter(self):
+        res = self.client().delete('/questions', json = {})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_400_sent_for_bulk_delete_by_search_without_words(self):
+        res = self.client().delete('/questions', json = {'searchTerm': '%'})
+        data = json.loads(res.data)
+        res_total = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+        self.assertTrue(json.loads(res_total.data)['total_questions'])
+
+    def test_search_takes_like_wildcards_literally(self):
+        for search_term in ('%', '_'):
+            res = self.client().post('/questions',
+                                     json = {'searchTerm': search_term})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['total_questions'], 0)
+
+    def test_export_questions(self):
+        res_total = self.client().get('/questions')
+        total_questions_count = json.loads(res_total.data)['total_questions']
+
+        res = self.client().get('/questions/export')
+        lines = res.data.decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), total_questions_count)
+        self.assertEqual(set(json.loads(lines[0])),
+                         {'id', 'question', 'answer', 'category', 'difficulty'})
+
+    def test_export_questions_of_a_category_as_csv(self):
+        res = self.client().get('/questions/export?format=csv&category=1')
+        lines = res.data.decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertTrue(len(lines) > 1)
+
+    def test_400_export_questions_with_invalid_filter(self):
+        for query in ('category=abc', 'difficulty=x', 'format=xml'):
+            res = self.client().get('/questions/export?' + query)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
     def test_get_categories(self):
         res = self.client().get('/categories')
         data = json.loads(res.data)
@@ -185,6 +658,70 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
         self.assertTrue(data['total_categories'])
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res_cached = self.client().get('/categories',
+                                       headers={'If-None-Match': etag})
+
+        self.assertEqual(res_cached.status_code, 304)
+        self.assertFalse(res_cached.data)
+
+    def test_get_category_counts(self):
+        res = self.client().get('/categories?with_counts=1')
+        data = json.loads(res.data)
+        total_res = self.client().get('/questions')
+        total_data = json.loads(total_res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['category_counts']), set(data['categories']))
+        self.assertEqual(sum(data['category_counts'].values()) +
+                         data['uncategorized_count'],
+                         total_data['total_questions'])
+        self.assertEqual(data['total_questions'],
+                         total_data['total_questions'])
+
+    def test_stats_count_uncategorized_questions(self):
+        with self.app.app_context():
+            Question('uncategorized question', 'answer', None, 2).insert()
+
+        res = self.client().get('/stats')
+        data = json.loads(res.data)
+        res_counts = self.client().get('/categories?with_counts=1')
+        data_counts = json.loads(res_counts.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['uncategorized'],
+                         {'total_questions': 1, 'difficulties': {'2': 1}})
+        self.assertEqual(sum(category['total_questions']
+                             for category in data['categories'].values()) +
+                         data['uncategorized']['total_questions'],
+                         data['total_questions'])
+        self.assertEqual(data_counts['uncategorized_count'], 1)
+        self.assertEqual(sum(data_counts['category_counts'].values()) + 1,
+                         data_counts['total_questions'])
+
+    def test_stats_follow_added_and_deleted_questions(self):
+        res = self.client().get('/stats')
+        before = json.loads(res.data)
+        new_question = {'question': 'Which planet is known as the red one?',
+                        'answer': 'Mars', 'category': 1, 'difficulty': 2}
+        res = self.client().post('/questions', json = new_question)
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().get('/stats')
+        after = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(after['total_questions'],
+                         before['total_questions'] + 1)
+        self.assertEqual(after['categories']['1']['total_questions'],
+                         before['categories']['1']['total_questions'] + 1)
+
+        self.client().delete(f'/questions/{question_id}')
+        res = self.client().get('/stats')
+        self.assertEqual(json.loads(res.data), before)
+
     def test_get_paginated_questions(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -195,6 +732,166 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
         self.assertTrue(len(data['questions']))
 
+    def test_cached_questions_page_follows_writes(self):
+        res_before = self.client().get('/questions')
+        total_before = json.loads(res_before.data)['total_questions']
+        self.client().get('/questions')
+
+        new_question = {'question': 'new question',
+                        'answer': 'new answer',
+                        'difficulty': 3,
+                        'category': 5}
+        res_add = self.client().post('/questions?return=minimal',
+                                     json = new_question)
+        question_id = json.loads(res_add.data)['created']
+        res_after_add = self.client().get('/questions')
+
+        self.client().delete(f'/questions/{question_id}?return=minimal')
+        res_after_delete = self.client().get('/questions')
+
+        self.assertEqual(json.loads(res_after_add.data)['total_questions'],
+                         total_before + 1)
+        self.assertEqual(json.loads(res_after_delete.data)['total_questions'],
+                         total_before)
+
+    def test_listed_questions_match_question_format(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            for listed_question in data['questions']:
+                question = Question.query.get(listed_question['id'])
+                self.assertEqual(listed_question, question.format())
+
+    def test_get_category_questions(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 1)
+        self.assertTrue(len(data['questions']))
+        for question in data['questions']:
+            self.assertEqual(question['category'], 1)
+
+    def test_get_second_page_of_questions(self):
+        res_first = self.client().get('/questions?page=1')
+        data_first = json.loads(res_first.data)
+        res = self.client().get('/questions?page=2')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], data_first['total_questions'])
+        self.assertTrue(len(data['questions']))
+        self.assertGreater(data['questions'][0]['id'],
+                           data_first['questions'][-1]['id'])
+
+    def test_walk_questions_with_cursor(self):
+        res_total = self.client().get('/questions')
+        total_questions_count = json.loads(res_total.data)['total_questions']
+
+        seen_ids = []
+        cursor = 0
+        while cursor is not None:
+            res = self.client().get(f'/questions?after_id={cursor}&limit=7')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['success'])
+            self.assertTrue(len(data['questions']) <= 7)
+            seen_ids.extend(question['id'] for question in data['questions'])
+            cursor = data['next_cursor']
+
+        self.assertEqual(len(seen_ids), total_questions_count)
+        self.assertEqual(seen_ids, sorted(seen_ids))
+
+    def test_400_sent_requesting_cursor_page_with_invalid_limit(self):
+        res = self.client().get('/questions?after_id=0&limit=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_400_sent_requesting_cursor_page_with_invalid_cursor(self):
+        for query in ('after_id=abc', 'after_id=0&limit=abc'):
+            res = self.client().get('/questions?' + query)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_listings_stay_within_query_budget(self):
+        self.app.config['QUERY_BUDGET'] = 2
+        self.addCleanup(self.app.config.__setitem__, 'QUERY_BUDGET', None)
+
+        for path in ['/categories', '/questions', '/categories/1/questions']:
+            res = self.client().get(path)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.headers['Server-Timing'].startswith('db;dur='))
+            self.assertTrue(res.headers['Server-Timing'].endswith(
+                'queries, 0 rows affected"'))
+
+    def test_get_metrics(self):
+        # A new app starts counting from zero
+        client = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL}).\
+            test_client()
+        client.get('/categories')
+        client.get('/questions?page=1000')
+
+        res = client.get('/metrics')
+        metrics = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn('trivia_requests_total{method="GET",route="/categories",'
+                      'status="200"} 1', metrics)
+        self.assertIn('trivia_request_duration_seconds_count{method="GET",'
+                      'route="/questions"} 1', metrics)
+        self.assertIn('trivia_errors_total{status="404"} 1', metrics)
+
+    def test_read_replica_is_instrumented(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database_url = 'sqlite:///' + os.path.join(directory.name, 'trivia.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_url,
+                          'DATABASE_REPLICA_URL': database_url,
+                          'SQLALCHEMY_ENGINE_OPTIONS': {'poolclass': QueuePool},
+                          'QUERY_STATS': True,
+                          'INIT_DB': True})
+        client = app.test_client()
+
+        res = client.post('/questions', json = {'searchTerm': 'title'})
+        metrics = client.get('/metrics').data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('desc="0 queries', res.headers['Server-Timing'])
+        self.assertIn('trivia_db_pool_connections{bind="default",state="size"}',
+                      metrics)
+        self.assertIn('trivia_db_pool_connections{bind="replica",state="size"}',
+                      metrics)
+
+    def test_create_app_does_not_connect(self):
+        # The database can't be opened, which only matters once it is used
+        app = create_app({'SQLALCHEMY_DATABASE_URI':
+                          'sqlite:////nonexistent/directory/trivia.db'})
+
+        self.assertIn('init-db', app.cli.commands)
+
+    def test_engine_options_from_env(self):
+        options = engine_options_from_env({'DB_POOL_SIZE': '20',
+                                           'DB_MAX_OVERFLOW': '5',
+                                           'DB_POOL_PRE_PING': 'true',
+                                           'DB_STATEMENT_TIMEOUT': '5000'})
+
+        self.assertEqual(options['pool_size'], 20)
+        self.assertEqual(options['max_overflow'], 5)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=5000'})
+        self.assertEqual(engine_options_from_env({}), {})
+
     def test_404_sent_requesting_beyound_valid_page(self):
         res = self.client().get('/questions?page=1000')
         data = json.loads(res.data)